@@ -2,7 +2,7 @@
 
 import sys
 
-dev_tty = open("/dev/tty", "w")
+dev_tty = None
 def print_msg(msg):
     print(msg, file=dev_tty)
 
@@ -48,38 +48,20 @@ def validate_choices(choice_str, input_lines):
         raise RuntimeError("Select at least one valid index")
     return indices
 
-input_lines = []
-for line in sys.stdin:
-    line = line.strip()
-    input_lines.append(line)
-
-# Change stdin back to user's input
-sys.stdin = open('/dev/tty')
-
-results = []
-if len(input_lines) == 0:
-    print_msg("No results")
-elif len(input_lines) == 1:
-    print_msg("One result: " + input_lines[0])
-    results.append(input_lines[0])
-else:
-    # Let user choose which lines they want
+def read_input_lines(input_stream):
+    input_lines = []
+    for line in input_stream:
+        line = line.strip()
+        input_lines.append(line)
+    return input_lines
+
+def print_numbered_lines(input_lines):
     for idx, line in enumerate(input_lines):
         print_msg("%i\t%s" % (idx, line))
 
-    selection_valid = False
-    indices = []
-    while not selection_valid:
-        print_msg("Use which? ")
-        try :
-            choice_str = input()
-        except KeyboardInterrupt:
-            sys.exit(1)
-        try: 
-            indices = validate_choices(choice_str, input_lines)
-            selection_valid = True;
-        except RuntimeError as e:
-            print_msg(str(e))
+def select_lines(indices, input_lines):
+    """Expands the index sets returned by validate_choices into the lines they select"""
+    results = []
     for index_set in indices:
         if len(index_set) == 1:
             results.append(input_lines[index_set[0]])
@@ -89,8 +71,46 @@ else:
                 results.append(input_lines[index])
         else:
             print("Ignoring invalid index set: " + str(index_set))
+    return results
+
+def main():
+    global dev_tty
+    dev_tty = open("/dev/tty", "w")
+
+    input_lines = read_input_lines(sys.stdin)
+
+    # Change stdin back to user's input
+    sys.stdin = open('/dev/tty')
+
+    results = []
+    if len(input_lines) == 0:
+        print_msg("No results")
+    elif len(input_lines) == 1:
+        print_msg("One result: " + input_lines[0])
+        results.append(input_lines[0])
+    else:
+        # Let user choose which lines they want
+        print_numbered_lines(input_lines)
+
+        selection_valid = False
+        indices = []
+        while not selection_valid:
+            print_msg("Use which? ")
+            try :
+                choice_str = input()
+            except KeyboardInterrupt:
+                sys.exit(1)
+            try: 
+                indices = validate_choices(choice_str, input_lines)
+                selection_valid = True;
+            except RuntimeError as e:
+                print_msg(str(e))
+        results = select_lines(indices, input_lines)
+
+    for result in results:
+        print(result)
 
-for result in results:
-    print(result)
+    dev_tty.close()
 
-dev_tty.close()
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""
+Headless benchmark for the interactive journal UI
+
+Builds a MainFrame over synthetic journals of various sizes, feeds it scripted keypress sequences without a real
+terminal (rendering straight to canvases), and reports per-keystroke latency, render time, and peak memory
+"""
+
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import importlib.util
+import tracemalloc
+
+UTILS_DIRPATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, UTILS_DIRPATH)
+import journal_core
+import synthetic_journal
+
+# The hyphen in the filename means we can't use a regular import
+_spec = importlib.util.spec_from_file_location(
+    "interactive_journal",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "interactive-journal.py"),
+)
+interactive_journal = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(interactive_journal)
+
+SCREEN_SIZE = (120, 40)
+
+# Only the top of the list gets touched by the scripts that hit the filesystem (e.g. 'dd'), so only those entries
+# need real files on disk
+NUM_ENTRIES_ON_DISK = 50
+
+# Scripted keypress sequences; each one runs against a freshly-built frame
+SCRIPTS = {
+    "navigation": ['j'] * 50 + ['J'] * 10 + ['K'] * 5 + ['k'] * 20 + ['G'],
+    "jump": list("gg") + list("500G") + list("gg") + list("G"),
+    "delete": list("dd") * 5,
+    "search": list("/review") + ['enter'] + ['j'] * 10 + ['/', 'enter'],
+    "batch": ['x', 'j'] * 10 + list("t+bench") + ['enter', 'u'],
+}
+
+def load_entries(filenames):
+    entries = [journal_core.EntryAndMetadata(filename) for filename in filenames]
+    entries.sort(key=journal_core.ENTRY_SORTING_FUNCS[journal_core.TIMESTAMP_SORT], reverse=True)
+    return entries
+
+def create_journal_dir(entries):
+    journal_dirpath = tempfile.mkdtemp(prefix="interactive-journal-benchmark-")
+    for entry in entries[:NUM_ENTRIES_ON_DISK]:
+        open(os.path.join(journal_dirpath, entry.filename), "w").close()
+    return journal_dirpath
+
+def render(frame):
+    canvas = frame.render(SCREEN_SIZE, focus=True)
+    # Canvases are composed lazily, so walk the content to pay the full cost of producing the screen
+    for _ in canvas.content():
+        pass
+
+def run_script(frame, keys):
+    render(frame)
+    for key in keys:
+        frame.keypress(SCREEN_SIZE, key)
+        render(frame)
+
+def benchmark_size(num_entries, script_names):
+    filenames = synthetic_journal.generate_filenames(num_entries)
+
+    load_start = time.perf_counter()
+    entries = load_entries(filenames)
+    load_secs = time.perf_counter() - load_start
+
+    results = []
+    for script_name in script_names:
+        instrumentation = interactive_journal.KeypressInstrumentation()
+        journal_dirpath = create_journal_dir(entries)
+        build_start = time.perf_counter()
+        frame = interactive_journal.MainFrame(journal_core.EntryStore(entries), journal_dirpath, instrumentation=instrumentation)
+        build_secs = time.perf_counter() - build_start
+        run_script(frame, SCRIPTS[script_name])
+        shutil.rmtree(journal_dirpath)
+
+        # Memory gets its own pass, since tracemalloc slows everything down enough to skew the timings
+        journal_dirpath = create_journal_dir(entries)
+        tracemalloc.start()
+        run_script(interactive_journal.MainFrame(journal_core.EntryStore(entries), journal_dirpath), SCRIPTS[script_name])
+        _, peak_bytes = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        shutil.rmtree(journal_dirpath)
+
+        key_histogram = instrumentation.histograms[interactive_journal.KeypressInstrumentation.KEYPRESS_STAGE]
+        render_histogram = instrumentation.histograms[interactive_journal.KeypressInstrumentation.RENDER_STAGE]
+        results.append({
+            "entries": num_entries,
+            "script": script_name,
+            "load_ms": load_secs * 1000,
+            "build_ms": build_secs * 1000,
+            "key_p50_us": key_histogram.percentile(50),
+            "key_p99_us": key_histogram.percentile(99),
+            "key_max_us": key_histogram.max_value,
+            "render_p50_us": render_histogram.percentile(50),
+            "render_p99_us": render_histogram.percentile(99),
+            "peak_mb": peak_bytes / (1024 * 1024),
+        })
+    return results
+
+def print_results(results):
+    columns = ["entries", "script", "load_ms", "build_ms", "key_p50_us", "key_p99_us", "key_max_us", "render_p50_us", "render_p99_us", "peak_mb"]
+    print("  ".join("%14s" % column for column in columns))
+    for result in results:
+        print("  ".join(
+            "%14.1f" % result[column] if isinstance(result[column], float) else "%14s" % result[column]
+            for column in columns
+        ))
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", default="1000,10000,100000", help="Comma-separated journal sizes to benchmark")
+    parser.add_argument("--scripts", default=",".join(SCRIPTS.keys()), help="Comma-separated scripts to run, from: %s" % ", ".join(SCRIPTS.keys()))
+    args = parser.parse_args()
+
+    script_names = args.scripts.split(",")
+    for script_name in script_names:
+        if script_name not in SCRIPTS:
+            parser.error("Unknown script '%s'" % script_name)
+
+    results = []
+    for size_str in args.sizes.split(","):
+        results.extend(benchmark_size(int(size_str), script_names))
+    print_results(results)
+
+if __name__ == "__main__":
+    main()
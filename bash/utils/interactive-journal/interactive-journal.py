@@ -1,13 +1,116 @@
 import urwid
 import re
-from collections import defaultdict
+import os
+import sys
+import time
+import tempfile
+import argparse
+import cProfile
+import contextlib
+from collections import defaultdict, OrderedDict
+
+# journal.py lives one directory up and owns the entry filename format
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import journal_core
+import journal_batch
 
 PADDING_COLS = 2
 
+# Setting this to "1" is equivalent to passing --instrument
+INSTRUMENT_ENV_VAR = "INTERACTIVE_JOURNAL_INSTRUMENT"
+
+# How often we check the journal directory for entries that were created/renamed/deleted behind our back
+REFRESH_INTERVAL_SECS = 5
+
+# Key that starts/stops a cProfile capture of the keypress + render hot path (only when instrumentation is on)
+PROFILE_TOGGLE_KEY = 'P'
+
 PALETTE = [
     ('date', '', '', '', '#FEEC3E', '')
 ]
 
+class LatencyHistogram:
+    """
+    HDR-style histogram of latencies in microseconds
+
+    Values below 2^sub_bucket_bits are recorded exactly; above that, each power-of-two range is split into
+    2^(sub_bucket_bits - 1) linear sub-buckets, so the relative error of any percentile stays under 1% while
+    the number of buckets only grows with log(max value)
+    """
+
+    def __init__(self, sub_bucket_bits=8):
+        self._sub_bucket_bits = sub_bucket_bits
+        self._counts = defaultdict(int)
+        self.total_count = 0
+        self.max_value = 0
+
+    def record(self, value_us):
+        value_us = max(0, int(value_us))
+        shift = max(0, value_us.bit_length() - self._sub_bucket_bits)
+        # Bucket key is the lowest value that's equivalent to this one at the histogram's precision
+        self._counts[(value_us >> shift) << shift] += 1
+        self.total_count += 1
+        self.max_value = max(self.max_value, value_us)
+
+    def percentile(self, pct):
+        if self.total_count == 0:
+            return 0
+        threshold = self.total_count * pct / 100.0
+        running_count = 0
+        for bucket_value in sorted(self._counts.keys()):
+            running_count += self._counts[bucket_value]
+            if running_count >= threshold:
+                return bucket_value
+        return self.max_value
+
+class KeypressInstrumentation:
+    """
+    Opt-in recorder for how long keypress handling and redraws take, with on-demand cProfile capture
+    """
+
+    KEYPRESS_STAGE = "key"
+    BODY_STAGE = "body"
+    FOOTER_STAGE = "footer"
+    RENDER_STAGE = "render"
+
+    def __init__(self):
+        self.histograms = defaultdict(LatencyHistogram)
+        self._profiler = None
+
+    @contextlib.contextmanager
+    def measure(self, stage):
+        start_ns = time.perf_counter_ns()
+        try:
+            yield
+        finally:
+            self.histograms[stage].record((time.perf_counter_ns() - start_ns) // 1000)
+
+    def is_profiling(self):
+        return self._profiler is not None
+
+    def toggle_profiler(self):
+        """
+        Starts a cProfile capture if none is running; otherwise stops it, dumps the stats, and returns the dump's filepath
+        """
+        if self._profiler is None:
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+            return None
+
+        self._profiler.disable()
+        fd, dump_filepath = tempfile.mkstemp(prefix="interactive-journal-", suffix=".pstats")
+        os.close(fd)
+        self._profiler.dump_stats(dump_filepath)
+        self._profiler = None
+        return dump_filepath
+
+    def summary(self):
+        stage_summaries = []
+        for stage in (self.KEYPRESS_STAGE, self.RENDER_STAGE):
+            histogram = self.histograms[stage]
+            stage_summaries.append("%s p50=%dus p99=%dus" % (stage, histogram.percentile(50), histogram.percentile(99)))
+        return "   ".join(stage_summaries)
+
 class EagerlyProcessedCommand:
     def __init__(self, command_func, eager_processing_regex_str):
         self.command_func = command_func
@@ -61,14 +164,139 @@ class CommandRouter:
         return results
 
 class VimBindingsCheckBox(urwid.CheckBox):
+    def __init__(self, label, state=False, entry=None):
+        super().__init__(label, state=state)
+        self.entry = entry
+
     def keypress(self, size, key):
         if key == 'x':
             key = 'enter'
         return super().keypress(size, key)
 
+class EntryListWalker(urwid.ListWalker):
+    """
+    Walker over journal entries that only builds row widgets for the rows urwid actually asks for, so the list can
+    hold a million entries without a million CheckBoxes. Checked state lives here (keyed by filename) rather than in
+    the rows, so rows can be thrown away and rebuilt freely.
+    """
+
+    ROW_CACHE_SIZE = 512
+
+    def __init__(self, entries):
+        self._all_entries = sorted(entries, key=self._sort_key, reverse=True)
+        self.entries = self._all_entries
+        self.checked_filenames = set()
+        self.focus = 0
+        self._filter_keyword = ""
+        self._row_cache = OrderedDict()
+
+    @staticmethod
+    def _sort_key(entry):
+        return entry.creation_timestamp
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __getitem__(self, position):
+        row = self._row_cache.get(position)
+        if row is not None:
+            self._row_cache.move_to_end(position)
+            return row
+
+        entry = self.entries[position]
+        row = VimBindingsCheckBox(
+            [(u'date', u" %s" % entry.creation_timestamp), u'   %s' % entry.pseudo_name],
+            state=entry.filename in self.checked_filenames,
+            entry=entry,
+        )
+        urwid.connect_signal(row, 'change', self._on_row_checked)
+        self._row_cache[position] = row
+        if len(self._row_cache) > self.ROW_CACHE_SIZE:
+            self._row_cache.popitem(last=False)
+        return row
+
+    def next_position(self, position):
+        if position >= len(self.entries) - 1:
+            raise IndexError
+        return position + 1
+
+    def prev_position(self, position):
+        if position <= 0:
+            raise IndexError
+        return position - 1
+
+    def positions(self, reverse=False):
+        if reverse:
+            return range(len(self.entries) - 1, -1, -1)
+        return range(len(self.entries))
+
+    def set_focus(self, position):
+        if not 0 <= position < len(self.entries):
+            raise IndexError("No entry at position %d" % position)
+        self.focus = position
+        self._modified()
+
+    def set_filter(self, keyword):
+        """
+        Shows only the entries whose name contains the keyword (or all entries, if the keyword is empty)
+        """
+        self._filter_keyword = keyword
+        self._apply_filter()
+        self.focus = 0
+        self._row_cache.clear()
+        self._modified()
+
+    def get_focused_entry(self):
+        if len(self.entries) == 0:
+            return None
+        return self.entries[self.focus]
+
+    def get_checked_entries(self):
+        return [entry for entry in self._all_entries if entry.filename in self.checked_filenames]
+
+    def apply_changes(self, removed_filenames, added_entries):
+        """
+        Applies a whole batch of removals/additions in a single pass, keeping focus on the same entry if it survived
+        """
+        focused_entry = self.get_focused_entry()
+        removed_filenames = set(removed_filenames)
+        self.checked_filenames -= removed_filenames
+
+        # Re-adding an entry we already have replaces it, so applying the same change twice is harmless
+        replaced_filenames = removed_filenames | {entry.filename for entry in added_entries}
+        self._all_entries = [entry for entry in self._all_entries if entry.filename not in replaced_filenames]
+        self._all_entries.extend(added_entries)
+        self._all_entries.sort(key=self._sort_key, reverse=True)
+        self._apply_filter()
+
+        new_focus = min(self.focus, max(0, len(self.entries) - 1))
+        if focused_entry is not None and focused_entry.filename not in removed_filenames:
+            for idx, entry in enumerate(self.entries):
+                if entry.filename == focused_entry.filename:
+                    new_focus = idx
+                    break
+        self.focus = new_focus
+        self._row_cache.clear()
+        self._modified()
+
+    def _apply_filter(self):
+        if self._filter_keyword:
+            self.entries = [entry for entry in self._all_entries if self._filter_keyword in entry.pseudo_name]
+        else:
+            self.entries = self._all_entries
+
+    def _on_row_checked(self, row, new_state):
+        if new_state:
+            self.checked_filenames.add(row.entry.filename)
+        else:
+            self.checked_filenames.discard(row.entry.filename)
+
 class VimBindingsListBox(urwid.ListBox):
 
     def keypress(self, size, key):
+        # An empty list (no entries, or a search with no matches) has nowhere to jump to, and set_focus would raise
+        if key in ('J', 'K', 'G') and len(self.body) == 0:
+            return None
         if key == 'J':
             curr_idx = self.focus_position
             num_items = len(self.body)
@@ -100,17 +328,24 @@ class SearchBox(urwid.Edit):
         return super().keypress(size, key)
 
 class MainFrame(urwid.Frame):
-    def __init__(self):
-        # TODO change this
-        button_list = [VimBindingsCheckBox([(u'date', u" DATE"), u'   FILENAME']) for item in range(1, 51)]
+    def __init__(self, entry_store, journal_dirpath, instrumentation=None):
+        self.journal_dirpath = journal_dirpath
+        self._snapshot = journal_core.DirectorySnapshot(journal_dirpath)
 
         # Storing these for easier references later
-        self.list_pane = listbox = VimBindingsListBox(button_list)
+        self.entry_store = entry_store
+        self.list_walker = EntryListWalker(entry_store.get_all())
+        self.list_pane = VimBindingsListBox(self.list_walker)
         self.comms_box = urwid.Text("")
+        # Latency summary gets its own line so it never overwrites command feedback in the comms box
+        self.latency_box = urwid.Text("")
         self.command_box = urwid.Edit()
-        bottom_pane = urwid.Pile([self.command_box, self.comms_box])
+        bottom_pane = urwid.Pile([self.command_box, self.comms_box, self.latency_box])
         super().__init__(self.list_pane, footer=bottom_pane)
 
+        # None unless the user opted in, so the uninstrumented path pays nothing but a null context
+        self.instrumentation = instrumentation
+
         # The command router, which gets first dibs on keypresses done in the list
         # If the leader matches a known leader char, the user gets sent to the command input box
         self.command_router = CommandRouter().add_cmd(
@@ -121,21 +356,45 @@ class MainFrame(urwid.Frame):
             ["d"],
             self._process_delete_command,
             eager_processing_regex_str="dd"
+        ).add_cmd(
+            ["/"],
+            self._process_search_command,
+        ).add_cmd(
+            ["t"],
+            self._process_retag_command,
+        ).add_cmd(
+            ["m"],
+            self._process_move_command,
         )
 
     def keypress(self, size, key):
-        result = key
+        with self._measure(KeypressInstrumentation.KEYPRESS_STAGE):
+            result = key
+
+            # First try handling with our custom handlers
+            if self.get_focus() == 'body':
+                with self._measure(KeypressInstrumentation.BODY_STAGE):
+                    result = self._process_body_keypress(key)
+            elif self.get_focus() == 'footer':
+                with self._measure(KeypressInstrumentation.FOOTER_STAGE):
+                    result = self._process_footer_keypress(key)
+
+            # If we still haven't handled the keypress, pass it to the superclass
+            if result is not None:
+                result = super().keypress(size, key)
+
+        if self.instrumentation is not None and not self.instrumentation.is_profiling():
+            self.latency_box.set_text(self.instrumentation.summary())
+        return result
 
-        # First try handling with our custom handlers
-        if self.get_focus() == 'body':
-            result = self._process_body_keypress(key)
-        elif self.get_focus() == 'footer':
-            result = self._process_footer_keypress(key)
+    def render(self, size, focus=False):
+        with self._measure(KeypressInstrumentation.RENDER_STAGE):
+            return super().render(size, focus)
 
-        # If we still haven't handled the keypress, pass it to the superclass
-        if result is not None:
-            result = super().keypress(size, key)
-        return result
+    def _measure(self, stage):
+        if self.instrumentation is None:
+            return contextlib.nullcontext()
+        return self.instrumentation.measure(stage)
 
     def _process_body_keypress(self, key):
         """
@@ -144,12 +403,22 @@ class MainFrame(urwid.Frame):
         if self.command_router.is_valid_command_leader_char(key):
             self._focus_footer(key)
             return None
+        if key == PROFILE_TOGGLE_KEY and self.instrumentation is not None:
+            dump_filepath = self.instrumentation.toggle_profiler()
+            if dump_filepath is None:
+                self.comms_box.set_text("Profiling... press %s again to stop" % PROFILE_TOGGLE_KEY)
+            else:
+                self.comms_box.set_text("Wrote profile to %s" % dump_filepath)
+            return None
         if key == 'enter':
-            # TODO open the thing under the cursor
+            # TODO open the thing under the cursor, then call self.refresh() once the editor exits
             return None
         if key == 'a':
             # TODO create a new file
             return None
+        if key == 'u':
+            self._process_undo_command(key)
+            return None
         if self.command_router.is_valid_command_leader_char(key):
             self._focus_footer(key)
             return None
@@ -195,6 +464,29 @@ class MainFrame(urwid.Frame):
 
         return key
 
+    def refresh(self, force=False):
+        """
+        Picks up entries that were created, renamed, modified, or deleted outside the UI (e.g. from the editor),
+        diffing only what changed into the entry store and the list so focus and checked rows survive
+        """
+        if not force and not self._snapshot.is_stale():
+            return
+        new_snapshot = journal_core.DirectorySnapshot(self.journal_dirpath)
+        removed_filenames, added_filenames, modified_filenames = self._snapshot.diff(new_snapshot)
+        self._snapshot = new_snapshot
+        # Modified entries are re-added so the store and list hold a fresh EntryAndMetadata for them; both replace
+        # by filename, so this doesn't duplicate anything
+        changed_entries = [
+            journal_core.EntryAndMetadata(filename, new_snapshot.get_dirpath(filename))
+            for filename in added_filenames | modified_filenames
+        ]
+        if len(removed_filenames) > 0 or len(changed_entries) > 0:
+            for filename in removed_filenames:
+                self.entry_store.remove(filename)
+            for entry in changed_entries:
+                self.entry_store.add(entry)
+            self.list_walker.apply_changes(removed_filenames, changed_entries)
+
     def _focus_footer(self, initiating_char):
         self.command_box.insert_text(initiating_char)
         # This only works because we have just a single input element in the footer Pile!
@@ -214,7 +506,7 @@ class MainFrame(urwid.Frame):
         if command_str == "gg":
             output_index = 0
         elif command_str[-1] == "G":
-            num_list_items = len(body_listbox.body)
+            num_list_items = len(self.list_walker)
             g_stripped = command_str.rstrip("G")
             try:
                 output_index = min(num_list_items, int(g_stripped)) - 1
@@ -222,36 +514,103 @@ class MainFrame(urwid.Frame):
                 raise ValueError("Invalid command string '%s' for jump command" % command_str)
         if output_index is None:
             raise ValueError("Invalid command string '%s' for jump command" % command_str)
+        if len(self.list_walker) == 0:
+            return
         self.list_pane.set_focus(output_index)
 
     def _process_delete_command(self, command_str):
         """
-        Callback to run if the user requests to delete an entry
+        Callback to run if the user requests to delete the checked entries (or the focused one, if none are checked)
         """
-        # TODO actually get entry name
-        file = "test-file"
-
-        # TODO popup dialog box to confirm
+        # TODO popup dialog box to confirm (deletes are undoable in the meantime)
+        target_entries = self._get_target_entries()
+        result = journal_batch.delete_entries(self.journal_dirpath, target_entries)
+        self._apply_batch_result("Deleted", result)
 
+    def _process_retag_command(self, command_str):
+        """
+        Callback to run if the user retags the checked entries (or the focused one), e.g. 't +work -personal'
+        """
+        tags_to_add = []
+        tags_to_remove = []
+        for token in command_str[1:].split():
+            if token.startswith("-"):
+                tags_to_remove.append(token[1:])
+            else:
+                tags_to_add.append(token.lstrip("+"))
+        result = journal_batch.retag_entries(self.journal_dirpath, self._get_target_entries(), tags_to_add, tags_to_remove)
+        self._apply_batch_result("Retagged", result)
 
+    def _process_move_command(self, command_str):
+        """
+        Callback to run if the user moves the checked entries (or the focused one) to another directory, e.g. 'm ~/archive'
+        """
+        dest_dirpath = os.path.expanduser(command_str[1:].strip())
+        if not os.path.isdir(dest_dirpath):
+            self.comms_box.set_text("Not a directory: '%s'" % dest_dirpath)
+            return
+        result = journal_batch.move_entries(self.journal_dirpath, self._get_target_entries(), dest_dirpath)
+        self._apply_batch_result("Moved", result)
+
+    def _process_undo_command(self, command_str):
+        """
+        Callback to run if the user wants to revert the last delete/retag/move batch
+        """
+        result = journal_batch.undo_last_batch(self.journal_dirpath)
+        self._apply_batch_result("Reverted", result)
+
+    def _get_target_entries(self):
+        checked_entries = self.list_walker.get_checked_entries()
+        if len(checked_entries) > 0:
+            return checked_entries
+        focused_entry = self.list_walker.get_focused_entry()
+        return [focused_entry] if focused_entry is not None else []
+
+    def _apply_batch_result(self, verb, result):
+        result.apply_to_store(self.entry_store)
+        self.list_walker.apply_changes(result.removed_filenames, result.added_entries)
+        message = "%s %d entries" % (verb, len(result.completed_renames))
+        if len(result.failures) > 0:
+            src, _, error = result.failures[0]
+            message += "; %d failed (e.g. %s: %s)" % (len(result.failures), os.path.basename(src), error)
+        self.comms_box.set_text(message)
 
     def _process_search_command(self, command_str):
         """
         Callback to run if the user runs a command to filter the list
         """
+        self.list_walker.set_filter(command_str[1:])
 
 def handle_unhandled_input(key):
     if key == 'q':
         raise urwid.ExitMainLoop()
 
+def refresh_periodically(loop, frame):
+    frame.refresh()
+    loop.set_alarm_in(REFRESH_INTERVAL_SECS, refresh_periodically, frame)
+
 def main():
-    frame = MainFrame()
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--instrument",
+        default=os.environ.get(INSTRUMENT_ENV_VAR) == "1",
+        action='store_true',
+        help="Record keypress/redraw latencies (shown in the footer); '%s' toggles a cProfile capture" % PROFILE_TOGGLE_KEY,
+    )
+    args = parser.parse_args()
+
+    entry_store = journal_core.load_entries(roots=[journal_core.JOURNAL_LOC])
+
+    instrumentation = KeypressInstrumentation() if args.instrument else None
+    frame = MainFrame(entry_store, journal_core.JOURNAL_LOC, instrumentation=instrumentation)
     loop = urwid.MainLoop(
         frame,
         palette=PALETTE,
         unhandled_input=handle_unhandled_input,
     )
     loop.screen.set_terminal_properties(colors=256)
+    loop.set_alarm_in(REFRESH_INTERVAL_SECS, refresh_periodically, frame)
     loop.run()
 
-main()
+if __name__ == "__main__":
+    main()
@@ -1,129 +1,269 @@
 import os
+import re
+import sys
 import datetime
-from collections import defaultdict
 import argparse
 
-# TODO change to parameterization
-JOURNAL_LOC = os.path.expanduser("~/gdrive/journal")
+import journal_core
+import journal_batch
+import journal_links
+import journal_pack
+import journal_warm
+# journal_match, journal_stats, and journal_dupes pull in NumPy when it's installed, which would slow down every other
+# command's startup, so they're imported by the commands that use them instead
 
-# Classes ====================================================================================================
+# Helper Functions ====================================================================================================
+def render_entries(entries, entry_sort_type, sort_reverse):
+    sorted_entries = sorted(entries, key=journal_core.ENTRY_SORTING_FUNCS[entry_sort_type], reverse=sort_reverse)
+    render_sorted_entries(sorted_entries)
 
-# Keys for the dict of file + metadata we pass around
-class EntryAndMetadata:
+def render_sorted_entries(sorted_entries):
     """
-    Class to contain information about a journal entry - filename on disk, date of creation, tags, etc.
+    Prints entries as they arrive, so a lazily-merged stream starts printing before it's been fully consumed
     """
+    num_rendered = 0
+    for entry in sorted_entries:
+        print(entry)
+        num_rendered += 1
+    if num_rendered == 0:
+        render_no_results()
 
-    MISSING_DATE_FORMAT_DATE = datetime.datetime(1970, 1, 1, 0, 0, 0)    # Date we assume an entry was written if we can't parse the date
-    FILENAME_DATE_FMTS = [
-        "%Y-%m-%d_%H-%M-%S",
-        "%Y-%m-%d"
-    ]
+def render_no_results():
+    print("              \033[90m<No results>")
 
-    def __init__(self, filename):
-        filename_minus_ext, extension = os.path.splitext(filename)
+def _load_streams(args, predicate=None, tag=None):
+    if args.profiler.enabled:
+        return journal_core.load_profiled_entry_streams(args.profiler, args.roots, args.sort, args.reverse, predicate, since=args.since, until=args.until, tag=tag)
+    return journal_core.load_sorted_entry_streams(args.roots, args.sort, args.reverse, predicate, since=args.since, until=args.until, tag=tag)
 
-        filename_fragments = filename_minus_ext.split("~")
-        self.pseudo_name = filename_fragments[0] + extension
-        created_timestamp_str = filename_fragments[1] if len(filename_fragments) >= 2 else ""
-        tags_str = filename_fragments[2] if len(filename_fragments) >= 3 else ""
+# Commands ====================================================================================================
 
-        self.creation_timestamp = EntryAndMetadata.MISSING_DATE_FORMAT_DATE
-        for date_format in EntryAndMetadata.FILENAME_DATE_FMTS:
-            try:
-                self.creation_timestamp = datetime.datetime.strptime(created_timestamp_str, date_format)
-                break
-            except ValueError:
-                pass
-        self.tags = tags_str.split(",") if len(tags_str) > 0 else []
+def list_entries(args):
+    streams = _load_streams(args)
+    with args.profiler.stage("render"):
+        render_sorted_entries(journal_core.merge_entry_streams(streams, args.sort, args.reverse))
 
-    def __repr__(self):
-        return self.filename
+def find_entries(args):
+    predicate = None
+    if args.name:
+        predicate = lambda entry: args.name in entry.pseudo_name
+    streams = _load_streams(args, predicate, tag=args.tag)
+    with args.profiler.stage("render"):
+        render_sorted_entries(journal_core.merge_entry_streams(streams, args.sort, args.reverse))
 
-    def __str__(self):
-        tag_str = "   \033[35m%s" % " ".join(sorted(self.tags)) if len(self.tags) > 0 else ""
-        return "\033[33m%s   \033[37m%s%s" % (self.creation_timestamp, self.pseudo_name, tag_str)
+def partition_journal(args):
+    renames = []
+    for filename in journal_core.scan_journal_filenames(args.dirpath):
+        partition_dirname = journal_core.get_partition_dirname(journal_core.EntryAndMetadata(filename))
+        if partition_dirname is None:
+            continue
+        partition_dirpath = os.path.join(args.dirpath, partition_dirname)
+        os.makedirs(partition_dirpath, exist_ok=True)
+        renames.append((os.path.join(args.dirpath, filename), os.path.join(partition_dirpath, filename)))
 
+    result = journal_batch.run_logged_batch(args.dirpath, renames)
+    print("Moved %d entries into YYYY/MM partitions" % len(result.completed_renames))
+    for src, dst, error in result.failures:
+        print("Failed to move %s: %s" % (src, error), file=sys.stderr)
 
-class EntryStore:
-    """
-    Takes a list of EntryAndMetadata and processes it in an easily-queryable format
-    """
+def _entries_from_filepaths(filepaths):
+    return [journal_core.EntryAndMetadata(os.path.basename(filepath), os.path.dirname(filepath)) for filepath in filepaths]
 
-    def __init__(self, entry_list):
-        self._entries = set(entry_list)
-        self._tag_lookup = defaultdict(lambda: set())
-        for entry in self._entries:
-            for tag in entry.tags:
-                self._tag_lookup[tag].add(entry)
+def show_links(args):
+    link_indexes = journal_links.open_link_indexes(args.roots, refresh=not args.no_refresh)
+    linked_filepaths, unresolved_targets = journal_links.get_links(link_indexes, args.entry)
+    render_entries(_entries_from_filepaths(linked_filepaths), args.sort, args.reverse)
+    for target in unresolved_targets:
+        print("\033[90m<No entry for %s>" % target)
 
-    def get_all(self):
-        return self._entries
+def show_backlinks(args):
+    link_indexes = journal_links.open_link_indexes(args.roots, refresh=not args.no_refresh)
+    render_entries(_entries_from_filepaths(journal_links.get_backlinks(link_indexes, args.entry)), args.sort, args.reverse)
 
-    def get_by_tag(self, tag):
-        return self._tag_lookup.get(tag, set())
+def match_entries(args):
+    import journal_match
 
-    def get_by_name(self, keyword):
-        return [ entry for entry in self._entries if keyword in entry.pseudo_name]
+    entry_store = journal_core.load_entries(args.profiler, args.roots)
+    with args.profiler.stage("match"):
+        top_matches = journal_match.MatchIndex(entry_store.get_all()).top_matches(" ".join(args.query), args.top)
+    with args.profiler.stage("render"):
+        if args.paths:
+            for entry, _ in top_matches:
+                print(os.path.join(entry.dirpath, entry.filename))
+        else:
+            render_sorted_entries(entry for entry, _ in top_matches)
 
-# Helper Functions ====================================================================================================
-def load_entries():
-    journal_filenames = [filename for filename in os.listdir(JOURNAL_LOC) if os.path.isfile(os.path.join(JOURNAL_LOC, filename))]
-    entries = [ EntryAndMetadata(filename) for filename in journal_filenames]
-    return EntryStore(entries)
-
-TIMESTAMP_SORT = "DATE"
-ENTRY_NAME_SORT = "NAME"
-ENTRY_SORTING_FUNCS = {
-    TIMESTAMP_SORT: lambda entry_and_metadata: entry_and_metadata.creation_timestamp,
-    ENTRY_NAME_SORT: lambda entry_and_metadata: entry_and_metadata.pseudo_name,
-}
-def render_entries(entries, entry_sort_type, sort_reverse):
-    if len(entries) == 0:
-        print("              \033[90m<No results>")
-        return
+def show_stats(args):
+    import journal_stats
 
-    sorted_entries = sorted(entries, key=ENTRY_SORTING_FUNCS[entry_sort_type], reverse=sort_reverse)
-    for entry in sorted_entries:
-        print(entry)
+    with args.profiler.stage("count"):
+        entry_counts = journal_stats.load_file_counts(args.roots, use_pack=args.pack)
+    with args.profiler.stage("aggregate"):
+        stats = journal_stats.JournalStats(entry_counts)
+    with args.profiler.stage("render"):
+        stats.render(args.period, args.periods)
 
-# Commands ====================================================================================================
+def new_entry(args):
+    try:
+        entry = journal_core.create_entry(args.roots[0], args.name, args.tags or ())
+    except (ValueError, OSError) as e:
+        print("Error: %s" % e, file=sys.stderr)
+        sys.exit(1)
+    print(os.path.join(entry.dirpath, entry.filename))
 
-def list_entries(args):
-    entry_store = load_entries()
-    render_entries(entry_store.get_all(), args.sort, args.reverse)
+def find_dupes(args):
+    import journal_dupes
 
-def find_entries(args):
-    entry_store = load_entries()
-    if args.tag:
-        entries = entry_store.get_by_tag(args.tag)
-    if args.name:
-        entries = entry_store.get_by_name(args.name)
-    render_entries(entries, args.sort, args.reverse)
+    with args.profiler.stage("sign"):
+        signatures = journal_dupes.load_signatures(args.roots)
+    with args.profiler.stage("match"):
+        duplicate_pairs = journal_dupes.find_near_duplicates(signatures, args.min_similarity)
+    with args.profiler.stage("render"):
+        # Like 'match', --paths output is for scripts, which are better off with no lines than with a marker
+        if len(duplicate_pairs) == 0 and not args.paths:
+            render_no_results()
+        for similarity, filepath_a, filepath_b in duplicate_pairs:
+            if args.paths:
+                print("%.2f\t%s\t%s" % (similarity, filepath_a, filepath_b))
+                continue
+            entry_a, entry_b = _entries_from_filepaths([filepath_a, filepath_b])
+            print("\033[36m%3.0f%%   %s\n        %s" % (similarity * 100, entry_a, entry_b))
 
-# Arg Parsing ====================================================================================================
-parser = argparse.ArgumentParser()
-parser.add_argument("-s", "--sort", default=TIMESTAMP_SORT, choices=ENTRY_SORTING_FUNCS.keys())
-parser.add_argument("-r", "--reverse", default=False, action='store_true')
-subparsers = parser.add_subparsers(dest='command')
-subparsers.required = True
+def pack_journal(args):
+    for root in args.roots:
+        with args.profiler.stage("pack"):
+            result = journal_pack.update_pack(root, compress=not args.raw)
+        print("%s: packed %d changed entries, dropped %d removed, kept %d unchanged%s" % (
+            root,
+            result.num_packed,
+            result.num_removed,
+            result.num_unchanged,
+            " (compacted)" if result.compacted else "",
+        ))
+
+def warm_cache(args):
+    with args.profiler.stage("select"):
+        entries = journal_warm.select_entries(args.roots, args.num_entries, args.tags, since=args.since, until=args.until)
+    with args.profiler.stage("warm"):
+        result = journal_warm.warm_entries(entries, max_workers=args.jobs, rate=args.rate, force=args.force)
+    result.render()
+    for filepath, error in result.failures:
+        print("Failed to read %s: %s" % (filepath, error), file=sys.stderr)
 
+# Arg Parsing ====================================================================================================
 LIST_COMMAND = "ls"
 FIND_COMMAND = "find"
+PARTITION_COMMAND = "partition"
+LINKS_COMMAND = "links"
+BACKLINKS_COMMAND = "backlinks"
+MATCH_COMMAND = "match"
+STATS_COMMAND = "stats"
+WARM_COMMAND = "warm"
+PACK_COMMAND = "pack"
+NEW_COMMAND = "new"
+DUPES_COMMAND = "dupes"
 COMMAND_MAP = {
     LIST_COMMAND: list_entries,
     FIND_COMMAND: find_entries,
+    PARTITION_COMMAND: partition_journal,
+    LINKS_COMMAND: show_links,
+    BACKLINKS_COMMAND: show_backlinks,
+    MATCH_COMMAND: match_entries,
+    STATS_COMMAND: show_stats,
+    WARM_COMMAND: warm_cache,
+    PACK_COMMAND: pack_journal,
+    NEW_COMMAND: new_entry,
+    DUPES_COMMAND: find_dupes,
 }
 
-# ls command
-ls_parser = subparsers.add_parser(LIST_COMMAND, help="Listing journal entries")
+RELATIVE_DATE_REGEX = re.compile(r"([0-9]+)d")
+
+def parse_date_arg(date_str):
+    """
+    Accepts YYYY-MM-DD, or e.g. '30d' for 30 days ago
+    """
+    relative_match = RELATIVE_DATE_REGEX.fullmatch(date_str)
+    if relative_match:
+        return datetime.datetime.now() - datetime.timedelta(days=int(relative_match.group(1)))
+    try:
+        return datetime.datetime.strptime(date_str, "%Y-%m-%d")
+    except ValueError:
+        raise argparse.ArgumentTypeError("Invalid date '%s'; expected YYYY-MM-DD or Nd" % date_str)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-s", "--sort", default=journal_core.TIMESTAMP_SORT, choices=journal_core.ENTRY_SORTING_FUNCS.keys())
+    parser.add_argument("-r", "--reverse", default=False, action='store_true')
+    parser.add_argument("--root", dest="roots", action='append', help="Journal directory to read (repeatable); defaults to $%s or %s" % (journal_core.JOURNAL_ROOTS_ENV_VAR, journal_core.JOURNAL_LOC))
+    parser.add_argument("--since", type=parse_date_arg, help="Only entries created on or after this date (YYYY-MM-DD, or Nd for N days ago)")
+    parser.add_argument("--until", type=parse_date_arg, help="Only entries created before this date (YYYY-MM-DD, or Nd for N days ago)")
+    parser.add_argument("--profile", default=False, action='store_true', help="Report per-stage wall time and allocations on stderr")
+    parser.add_argument("--profile-dump", metavar="FILEPATH", help="Also write cProfile stats (loadable with pstats) to this file; implies --profile")
+    subparsers = parser.add_subparsers(dest='command')
+    subparsers.required = True
+
+    # ls command
+    ls_parser = subparsers.add_parser(LIST_COMMAND, help="Listing journal entries")
+
+    # find command
+    find_parser = subparsers.add_parser(FIND_COMMAND, help="Finding journal entries based off criteria")
+    search_type_group = find_parser.add_mutually_exclusive_group(required=True)
+    search_type_group.add_argument("-t", "--tag")
+    search_type_group.add_argument("-n", "--name")
+
+    # partition command
+    partition_parser = subparsers.add_parser(PARTITION_COMMAND, help="Moving a flat journal's dated entries into YYYY/MM subdirectories")
+    partition_parser.add_argument("dirpath", nargs='?', default=journal_core.JOURNAL_LOC)
+
+    # links & backlinks commands
+    for command, help_str in ((LINKS_COMMAND, "Listing the entries an entry links to"), (BACKLINKS_COMMAND, "Listing the entries that link to an entry")):
+        link_parser = subparsers.add_parser(command, help=help_str)
+        link_parser.add_argument("entry", help="Entry path, filename, or name (e.g. 'weekly-review')")
+        link_parser.add_argument("--no-refresh", default=False, action='store_true', help="Query the link index as-is, without checking for changed entries")
+
+    # match command
+    match_parser = subparsers.add_parser(MATCH_COMMAND, help="Ranking journal entries against a query, best match first")
+    match_parser.add_argument("query", nargs='*', help="Tokens that must each match the entry's name or tags, in any order")
+    match_parser.add_argument("-k", "--top", type=int, default=20, help="Number of matches to show")
+    match_parser.add_argument("--paths", default=False, action='store_true', help="Print full paths instead of formatted entries")
+
+    # stats command
+    stats_parser = subparsers.add_parser(STATS_COMMAND, help="Showing writing statistics: streaks, words per period, entry length trends")
+    stats_parser.add_argument("-p", "--period", default="month", choices=("day", "week", "month"), help="Bucket size for the trend table")
+    stats_parser.add_argument("-n", "--periods", type=int, default=12, help="Number of most recent periods to show")
+    stats_parser.add_argument("--pack", default=False, action='store_true', help="Update each root's pack and count changed entries out of it")
+
+    # warm command
+    warm_parser = subparsers.add_parser(WARM_COMMAND, help="Reading recent entries ahead of time so the sync client has them cached locally")
+    warm_parser.add_argument("-n", "--num-entries", type=int, default=200, help="Number of most recent entries to warm")
+    warm_parser.add_argument("-t", "--tag", dest="tags", action='append', help="Only warm entries with this tag (repeatable; any tag matches)")
+    warm_parser.add_argument("-j", "--jobs", type=int, default=8, help="Maximum number of concurrent reads")
+    warm_parser.add_argument("--rate", type=float, help="Maximum entries started per second (default: unlimited)")
+    warm_parser.add_argument("-f", "--force", default=False, action='store_true', help="Re-read entries even if they haven't changed since they were last warmed")
+
+    # pack command
+    pack_parser = subparsers.add_parser(PACK_COMMAND, help="Updating the single-file local snapshot of each root's entries")
+    pack_parser.add_argument("--raw", default=False, action='store_true', help="Store newly packed bodies uncompressed")
+
+    # new command
+    new_parser = subparsers.add_parser(NEW_COMMAND, help="Creating an empty entry in the first root and printing its path")
+    new_parser.add_argument("name", nargs='+', help="Name fragments, joined with '-'")
+    new_parser.add_argument("-t", "--tag", dest="tags", action='append', help="Tag for the entry (repeatable)")
+
+    # dupes command
+    dupes_parser = subparsers.add_parser(DUPES_COMMAND, help="Finding pairs of entries with near-identical contents")
+    dupes_parser.add_argument("-m", "--min-similarity", type=float, default=0.6, help="Minimum estimated Jaccard similarity (0-1) of the entries' word shingles")
+    dupes_parser.add_argument("--paths", default=False, action='store_true', help="Print tab-separated similarity and full paths instead of formatted entries")
 
-# find command
-find_parser = subparsers.add_parser(FIND_COMMAND, help="Finding journal entries based off criteria")
-search_type_group = find_parser.add_mutually_exclusive_group(required=True)
-search_type_group.add_argument("-t", "--tag")
-search_type_group.add_argument("-n", "--name")
+    args = parser.parse_args()
+    if args.roots is None:
+        args.roots = journal_core.JOURNAL_ROOTS
+    args.roots = [os.path.expanduser(root) for root in args.roots]
 
-args = parser.parse_args()
+    args.profiler = journal_core.StageProfiler(args.profile or args.profile_dump is not None, args.profile_dump)
+    args.profiler.start()
+    COMMAND_MAP[args.command](args)
+    args.profiler.finish()
 
-COMMAND_MAP[args.command](args)
+if __name__ == "__main__":
+    main()
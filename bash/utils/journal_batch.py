@@ -0,0 +1,140 @@
+"""
+Bulk delete/retag/move of journal entries, executed as a single batch with an undo log
+
+Every operation boils down to a list of renames (deleting moves the file into the journal's trash), so a batch is
+run by firing all of its renames concurrently - on a network mount that costs a handful of round-trips rather than
+one per file - and undoing a batch is just running its renames in reverse.
+"""
+
+import os
+import json
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import journal_core
+
+# Renames are almost pure I/O wait on network mounts, so we can afford many more threads than cores
+DEFAULT_MAX_WORKERS = 32
+
+TRASH_DIRNAME = "trash"
+UNDO_LOG_FILENAME = "undo-log.json"
+
+class BatchResult:
+    """
+    What a batch did to the set of entries in the journal directory, for applying to in-memory stores in one go
+    """
+
+    def __init__(self):
+        self.removed_filenames = []
+        self.added_entries = []
+        self.completed_renames = []
+        self.failures = []    # (src, dst, exception)
+
+    def apply_to_store(self, entry_store):
+        for filename in self.removed_filenames:
+            entry_store.remove(filename)
+        for entry in self.added_entries:
+            entry_store.add(entry)
+
+def _rename_without_clobbering(src, dst):
+    # os.rename silently replaces on POSIX, and losing an entry to a name collision is never what we want
+    if os.path.lexists(dst):
+        raise FileExistsError("Refusing to overwrite '%s'" % dst)
+    os.rename(src, dst)
+
+def execute_renames(journal_dirpath, renames, max_workers=DEFAULT_MAX_WORKERS):
+    """
+    Runs the (src, dst) renames concurrently, returning a BatchResult describing how the journal directory changed
+    """
+    result = BatchResult()
+    if len(renames) == 0:
+        return result
+
+    root_index = journal_core.RootIndex(journal_dirpath)
+    dir_mtime_ns_before = root_index.stat_listed_dirpaths(os.path.dirname(path) for rename in renames for path in rename)
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(renames))) as pool:
+        futures = {pool.submit(_rename_without_clobbering, src, dst): (src, dst) for src, dst in renames}
+        for future in as_completed(futures):
+            src, dst = futures[future]
+            try:
+                future.result()
+            except OSError as e:
+                result.failures.append((src, dst, e))
+                continue
+            result.completed_renames.append((src, dst))
+            # Entries in the journal's YYYY/MM partitions are just as much in the journal as top-level ones
+            if journal_core.is_root_or_partition_dirpath(journal_dirpath, os.path.dirname(src)):
+                result.removed_filenames.append(os.path.basename(src))
+            if journal_core.is_root_or_partition_dirpath(journal_dirpath, os.path.dirname(dst)):
+                result.added_entries.append(journal_core.EntryAndMetadata(os.path.basename(dst), os.path.dirname(dst)))
+
+    # Keeps the next 'ls' (or load) from having to rescan every directory the batch touched
+    root_index.record_renames(result.completed_renames, dir_mtime_ns_before)
+    return result
+
+# Undo Log ====================================================================================================
+def _get_undo_log_filepath(journal_dirpath):
+    return os.path.join(journal_dirpath, journal_core.JOURNAL_META_DIRNAME, UNDO_LOG_FILENAME)
+
+def _read_undo_log(journal_dirpath):
+    try:
+        with open(_get_undo_log_filepath(journal_dirpath)) as undo_log_fp:
+            return json.load(undo_log_fp)
+    except FileNotFoundError:
+        return []
+
+def _write_undo_log(journal_dirpath, batches):
+    journal_core.write_json_cache(_get_undo_log_filepath(journal_dirpath), batches)
+
+def run_logged_batch(journal_dirpath, renames):
+    result = execute_renames(journal_dirpath, renames)
+    if len(result.completed_renames) > 0:
+        batches = _read_undo_log(journal_dirpath)
+        batches.append(result.completed_renames)
+        _write_undo_log(journal_dirpath, batches)
+    return result
+
+def undo_last_batch(journal_dirpath):
+    """
+    Reverts the most recent batch; any renames that can't be reverted stay in the log so undo can be retried
+    """
+    batches = _read_undo_log(journal_dirpath)
+    if len(batches) == 0:
+        return BatchResult()
+    last_batch = batches.pop()
+    result = execute_renames(journal_dirpath, [(dst, src) for src, dst in last_batch])
+    if len(result.failures) > 0:
+        batches.append([(src, dst) for dst, src, _ in result.failures])
+    _write_undo_log(journal_dirpath, batches)
+    return result
+
+# Operations ====================================================================================================
+def _get_entry_dirpath(journal_dirpath, entry):
+    # Entries loaded from a partitioned journal know their YYYY/MM directory; ones built from a bare filename don't
+    return entry.dirpath if entry.dirpath is not None else journal_dirpath
+
+def delete_entries(journal_dirpath, entries):
+    """
+    Moves the entries into the journal's trash directory (which is what makes deletes undoable)
+    """
+    trash_dirpath = os.path.join(journal_dirpath, journal_core.JOURNAL_META_DIRNAME, TRASH_DIRNAME)
+    os.makedirs(trash_dirpath, exist_ok=True)
+    return run_logged_batch(journal_dirpath, [
+        (os.path.join(_get_entry_dirpath(journal_dirpath, entry), entry.filename), os.path.join(trash_dirpath, entry.filename))
+        for entry in entries
+    ])
+
+def retag_entries(journal_dirpath, entries, tags_to_add, tags_to_remove):
+    renames = []
+    for entry in entries:
+        new_tags = (set(entry.tags) | set(tags_to_add)) - set(tags_to_remove)
+        new_filename = entry.with_tags(new_tags)
+        if new_filename != entry.filename:
+            entry_dirpath = _get_entry_dirpath(journal_dirpath, entry)
+            renames.append((os.path.join(entry_dirpath, entry.filename), os.path.join(entry_dirpath, new_filename)))
+    return run_logged_batch(journal_dirpath, renames)
+
+def move_entries(journal_dirpath, entries, dest_dirpath):
+    return run_logged_batch(journal_dirpath, [
+        (os.path.join(_get_entry_dirpath(journal_dirpath, entry), entry.filename), os.path.join(dest_dirpath, entry.filename))
+        for entry in entries
+    ])
@@ -0,0 +1,180 @@
+"""
+Benchmark suite for journal.py and filter.py
+
+Generates synthetic journals of the requested sizes (including undated/date-only entries and deep subdirectories),
+times each stage of journal.py and filter.py against them, and writes the results to a JSON file so runs from
+different commits can be compared with --compare
+"""
+
+import io
+import os
+import sys
+import json
+import shutil
+import argparse
+import datetime
+import platform
+import tempfile
+import statistics
+import subprocess
+import contextlib
+import time
+
+import filter as line_filter
+import journal
+import journal_core
+import synthetic_journal
+
+QUERY_NAME = "review"
+
+# Roots to split the sorted entries across for the merge stage, as though they came from that many journals
+MERGE_NUM_STREAMS = 4
+
+def time_stage(func, repeat, setup=None):
+    """
+    Runs func repeat times (calling setup, untimed, before each run), returning the min/median wall time in ms plus
+    the last return value
+    """
+    durations_ms = []
+    result = None
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        result = func()
+        durations_ms.append((time.perf_counter() - start) * 1000)
+    return {"min_ms": min(durations_ms), "median_ms": statistics.median(durations_ms)}, result
+
+def _clear_root_cache(journal_dirpath):
+    shutil.rmtree(journal_core.get_root_cache_dirpath(journal_dirpath), ignore_errors=True)
+
+def _load_merged(journal_dirpath):
+    streams = journal_core.load_sorted_entry_streams([journal_dirpath], journal_core.TIMESTAMP_SORT, False)
+    return list(journal_core.merge_entry_streams(streams, journal_core.TIMESTAMP_SORT, False))
+
+def benchmark_journal(journal_dirpath, repeat):
+    """
+    Times the same load path ls/find use (RootIndex listing, parse, per-root sort, heap merge), both end to end and
+    stage by stage, with the root's listing cache cold and warm; then the EntryStore queries and rendering
+    """
+    stage_timings = {}
+    clear_cache = lambda: _clear_root_cache(journal_dirpath)
+    stage_timings["load_cold"], _ = time_stage(lambda: _load_merged(journal_dirpath), repeat, setup=clear_cache)
+    stage_timings["load_warm"], _ = time_stage(lambda: _load_merged(journal_dirpath), repeat)
+    load_dirpath_filenames = lambda: journal_core.RootIndex(journal_dirpath).load_dirpath_filenames()
+    stage_timings["scan_cold"], _ = time_stage(load_dirpath_filenames, repeat, setup=clear_cache)
+    stage_timings["scan_warm"], dirpath_filenames = time_stage(load_dirpath_filenames, repeat)
+    stage_timings["parse"], entries = time_stage(
+        lambda: [journal_core.EntryAndMetadata(filename, dirpath) for dirpath, filenames in dirpath_filenames for filename in filenames],
+        repeat,
+    )
+    sort_key = journal_core.ENTRY_SORTING_FUNCS[journal_core.TIMESTAMP_SORT]
+    stage_timings["sort"], _ = time_stage(lambda: sorted(entries, key=sort_key), repeat)
+    sorted_streams = [sorted(entries[idx::MERGE_NUM_STREAMS], key=sort_key) for idx in range(MERGE_NUM_STREAMS)]
+    stage_timings["merge"], _ = time_stage(
+        lambda: list(journal_core.merge_entry_streams(sorted_streams, journal_core.TIMESTAMP_SORT, False)),
+        repeat,
+    )
+    stage_timings["store_build"], entry_store = time_stage(lambda: journal_core.EntryStore(entries), repeat)
+    stage_timings["get_by_tag"], _ = time_stage(
+        lambda: [entry_store.get_by_tag(tag) for tag in synthetic_journal.TAGS],
+        repeat,
+    )
+    stage_timings["get_by_name"], _ = time_stage(lambda: entry_store.get_by_name(QUERY_NAME), repeat)
+    with open(os.devnull, "w") as devnull_fp, contextlib.redirect_stdout(devnull_fp):
+        stage_timings["render"], _ = time_stage(
+            lambda: journal.render_entries(entry_store.get_all(), journal_core.TIMESTAMP_SORT, False),
+            repeat,
+        )
+    return stage_timings
+
+def benchmark_filter(num_lines, repeat):
+    input_text = "".join("/some/journal/dir/%s\n" % filename for filename in synthetic_journal.generate_filenames(num_lines))
+    singles_choice_str = ",".join(str(idx) for idx in range(0, num_lines, max(1, num_lines // 1000)))
+    range_choice_str = "0-%d" % (num_lines - 1)
+
+    stage_timings = {}
+    stage_timings["read_input"], input_lines = time_stage(lambda: line_filter.read_input_lines(io.StringIO(input_text)), repeat)
+    with open(os.devnull, "w") as devnull_fp:
+        line_filter.dev_tty = devnull_fp
+        stage_timings["print_numbered"], _ = time_stage(lambda: line_filter.print_numbered_lines(input_lines), repeat)
+        line_filter.dev_tty = None
+    stage_timings["validate_singles"], singles_indices = time_stage(
+        lambda: line_filter.validate_choices(singles_choice_str, input_lines),
+        repeat,
+    )
+    stage_timings["validate_range"], range_indices = time_stage(
+        lambda: line_filter.validate_choices(range_choice_str, input_lines),
+        repeat,
+    )
+    stage_timings["select_range"], _ = time_stage(lambda: line_filter.select_lines(range_indices, input_lines), repeat)
+    return stage_timings
+
+def get_git_commit():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            stderr=subprocess.DEVNULL,
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def print_comparison(results, baseline):
+    print("%-10s %-10s %-18s %12s %12s %8s" % ("suite", "size", "stage", "baseline_ms", "current_ms", "ratio"))
+    for suite_name, sizes in results["suites"].items():
+        for size_str, stage_timings in sizes.items():
+            baseline_timings = baseline.get("suites", {}).get(suite_name, {}).get(size_str, {})
+            for stage_name, timing in stage_timings.items():
+                if stage_name not in baseline_timings:
+                    continue
+                baseline_ms = baseline_timings[stage_name]["min_ms"]
+                ratio = timing["min_ms"] / baseline_ms if baseline_ms > 0 else float("inf")
+                print("%-10s %-10s %-18s %12.2f %12.2f %7.2fx" % (suite_name, size_str, stage_name, baseline_ms, timing["min_ms"], ratio))
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", default="1000,10000", help="Comma-separated numbers of entries/lines to benchmark")
+    parser.add_argument("--repeat", type=int, default=5, help="Times to run each stage (min and median are reported)")
+    parser.add_argument("--undated-fraction", type=float, default=0.05)
+    parser.add_argument("--date-only-fraction", type=float, default=0.15)
+    parser.add_argument("--num-subdirs", type=int, default=20, help="Chains of nested subdirectories to add to each journal")
+    parser.add_argument("-o", "--output", default="journal-benchmark.json", help="Where to write the JSON results")
+    parser.add_argument("--compare", help="JSON results from an earlier run to compare against")
+    args = parser.parse_args()
+
+    results = {
+        "commit": get_git_commit(),
+        "timestamp": datetime.datetime.now().isoformat(),
+        "python": platform.python_version(),
+        "suites": {"journal": {}, "filter": {}},
+    }
+    for size_str in args.sizes.split(","):
+        num_entries = int(size_str)
+
+        journal_dirpath = tempfile.mkdtemp(prefix="journal-benchmark-")
+        try:
+            filenames = synthetic_journal.generate_filenames(
+                num_entries,
+                undated_fraction=args.undated_fraction,
+                date_only_fraction=args.date_only_fraction,
+            )
+            synthetic_journal.write_journal(journal_dirpath, filenames, num_subdirs=args.num_subdirs)
+            results["suites"]["journal"][size_str] = benchmark_journal(journal_dirpath, args.repeat)
+        finally:
+            _clear_root_cache(journal_dirpath)
+            shutil.rmtree(journal_dirpath)
+
+        results["suites"]["filter"][size_str] = benchmark_filter(num_entries, args.repeat)
+        print("Benchmarked size %d" % num_entries, file=sys.stderr)
+
+    with open(args.output, "w") as output_fp:
+        json.dump(results, output_fp, indent=2)
+    print("Wrote results to %s" % args.output, file=sys.stderr)
+
+    if args.compare:
+        with open(args.compare) as baseline_fp:
+            print_comparison(results, json.load(baseline_fp))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,652 @@
+"""
+Journal entries and the on-disk layout of journal roots: parsing entry filenames, the locally-cached listings of
+(optionally YYYY/MM-partitioned) roots, loading/sorting/merging entries across roots, and the caches and profiling
+shared by journal.py, the interactive journal, and the journal_* modules
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import heapq
+import hashlib
+import cProfile
+import tempfile
+import datetime
+import contextlib
+import tracemalloc
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+
+# Journal directories to read from, separated by os.pathsep; the first is the primary journal, where entries get
+# created and edited
+JOURNAL_ROOTS_ENV_VAR = "JOURNAL_ROOTS"
+JOURNAL_ROOTS = [
+    os.path.expanduser(root) for root in os.environ.get(JOURNAL_ROOTS_ENV_VAR, "").split(os.pathsep) if root
+] or [os.path.expanduser("~/gdrive/journal")]
+JOURNAL_LOC = JOURNAL_ROOTS[0]
+
+# Local (i.e. not on a synced mount) directory where per-root caches live
+LOCAL_CACHE_DIRPATH = os.path.expanduser("~/.cache/journal")
+
+# Partitioned journals keep dated entries in YYYY/MM/ subdirectories
+PARTITION_YEAR_REGEX = re.compile(r"[0-9]{4}")
+PARTITION_MONTH_REGEX = re.compile(r"(0[1-9]|1[0-2])")
+
+# Hidden directory inside the journal where tooling keeps its own state (trash, undo log, etc.)
+JOURNAL_META_DIRNAME = ".journal"
+
+# Threads for reading entry contents; reading off a network mount is almost pure I/O wait, so this is well above the
+# core count
+ENTRY_READ_MAX_WORKERS = 16
+
+# Classes ====================================================================================================
+
+# Keys for the dict of file + metadata we pass around
+class EntryAndMetadata:
+    """
+    Class to contain information about a journal entry - filename on disk, date of creation, tags, etc.
+    """
+
+    MISSING_DATE_FORMAT_DATE = datetime.datetime(1970, 1, 1, 0, 0, 0)    # Date we assume an entry was written if we can't parse the date
+    FILENAME_DATE_FMTS = [
+        "%Y-%m-%d_%H-%M-%S",
+        "%Y-%m-%d"
+    ]
+
+    def __init__(self, filename, dirpath=None):
+        self.filename = filename
+        self.dirpath = dirpath    # Directory the entry lives in, when known
+        filename_minus_ext, extension = os.path.splitext(filename)
+
+        filename_fragments = filename_minus_ext.split("~")
+        self.pseudo_name = filename_fragments[0] + extension
+        created_timestamp_str = filename_fragments[1] if len(filename_fragments) >= 2 else ""
+        tags_str = filename_fragments[2] if len(filename_fragments) >= 3 else ""
+
+        self.creation_timestamp = EntryAndMetadata.MISSING_DATE_FORMAT_DATE
+        for date_format in EntryAndMetadata.FILENAME_DATE_FMTS:
+            try:
+                self.creation_timestamp = datetime.datetime.strptime(created_timestamp_str, date_format)
+                break
+            except ValueError:
+                pass
+        self.tags = tags_str.split(",") if len(tags_str) > 0 else []
+
+    def with_tags(self, tags):
+        """
+        Returns the filename this entry would have with its tags replaced by the given ones
+        """
+        filename_minus_ext, extension = os.path.splitext(self.filename)
+        filename_fragments = filename_minus_ext.split("~")
+        filename_fragments += [""] * (3 - len(filename_fragments))
+        filename_fragments[2] = ",".join(sorted(tags))
+        return "~".join(filename_fragments) + extension
+
+    def __repr__(self):
+        return self.filename
+
+    def __str__(self):
+        tag_str = "   \033[35m%s" % " ".join(sorted(self.tags)) if len(self.tags) > 0 else ""
+        return "\033[33m%s   \033[37m%s%s" % (self.creation_timestamp, self.pseudo_name, tag_str)
+
+
+class EntryStore:
+    """
+    Takes a list of EntryAndMetadata and processes it in an easily-queryable format
+    """
+
+    def __init__(self, entry_list):
+        self._entries = set()
+        self._filename_lookup = {}
+        self._tag_lookup = defaultdict(lambda: set())
+        for entry in entry_list:
+            self.add(entry)
+
+    def add(self, entry):
+        # Re-adding a filename replaces the old entry, so applying the same change twice is harmless
+        self.remove(entry.filename)
+        self._entries.add(entry)
+        self._filename_lookup[entry.filename] = entry
+        for tag in entry.tags:
+            self._tag_lookup[tag].add(entry)
+
+    def remove(self, filename):
+        entry = self._filename_lookup.pop(filename, None)
+        if entry is None:
+            return
+        self._entries.discard(entry)
+        for tag in entry.tags:
+            self._tag_lookup[tag].discard(entry)
+
+    def get_all(self):
+        return self._entries
+
+    def get_by_tag(self, tag):
+        return self._tag_lookup.get(tag, set())
+
+    def get_by_name(self, keyword):
+        return [ entry for entry in self._entries if keyword in entry.pseudo_name]
+
+class DirectorySnapshot:
+    """
+    Size + mtime of every entry in a journal root, including its YYYY/MM partitions, so two snapshots can be diffed
+    to find what changed without re-reading anything
+    """
+
+    def __init__(self, dirpath):
+        self.dirpath = dirpath
+        self.dir_mtime_ns = {}     # dirpath -> mtime, for the root and every year/month directory
+        self.file_stats = {}       # filename -> (size, mtime_ns, dirpath)
+        self._add_directory(dirpath)
+        for year_dirname in self._list_subdirnames(dirpath, PARTITION_YEAR_REGEX):
+            year_dirpath = os.path.join(dirpath, year_dirname)
+            # Watching the year directory too is what lets is_stale notice a brand new month directory
+            self.dir_mtime_ns[year_dirpath] = os.stat(year_dirpath).st_mtime_ns
+            for month_dirname in self._list_subdirnames(year_dirpath, PARTITION_MONTH_REGEX):
+                self._add_directory(os.path.join(year_dirpath, month_dirname))
+
+    @staticmethod
+    def _list_subdirnames(dirpath, dirname_regex):
+        with os.scandir(dirpath) as dir_entries:
+            return [dir_entry.name for dir_entry in dir_entries if dir_entry.is_dir() and dirname_regex.fullmatch(dir_entry.name)]
+
+    def _add_directory(self, dirpath):
+        self.dir_mtime_ns[dirpath] = os.stat(dirpath).st_mtime_ns
+        with os.scandir(dirpath) as dir_entries:
+            for dir_entry in dir_entries:
+                if dir_entry.is_file():
+                    stat = dir_entry.stat()
+                    self.file_stats[dir_entry.name] = (stat.st_size, stat.st_mtime_ns, dirpath)
+
+    def get_dirpath(self, filename):
+        return self.file_stats[filename][2]
+
+    def is_stale(self):
+        """
+        Cheap check (a stat per directory) for whether files have been added, removed, or renamed since the snapshot
+        """
+        for dirpath, dir_mtime_ns in self.dir_mtime_ns.items():
+            try:
+                if os.stat(dirpath).st_mtime_ns != dir_mtime_ns:
+                    return True
+            except FileNotFoundError:
+                return True
+        return False
+
+    def diff(self, newer_snapshot):
+        """
+        Returns (removed_filenames, added_filenames, modified_filenames) going from this snapshot to the newer one; an
+        entry moved to another partition counts as modified
+        """
+        old_filenames = self.file_stats.keys()
+        new_filenames = newer_snapshot.file_stats.keys()
+        removed_filenames = old_filenames - new_filenames
+        added_filenames = new_filenames - old_filenames
+        modified_filenames = {
+            filename for filename in old_filenames & new_filenames
+            if self.file_stats[filename] != newer_snapshot.file_stats[filename]
+        }
+        return removed_filenames, added_filenames, modified_filenames
+
+class RootIndex:
+    """
+    Locally-cached listing of one journal root, trusted for as long as the relevant directory's mtime is unchanged
+    (adding, removing, or renaming a file always bumps it), so a warm scan of a slow mount costs a stat per directory
+    instead of a listdir plus a stat per file.
+
+    Roots can be flat, or partitioned into YYYY/MM/ subdirectories (see the 'partition' command). For partitioned
+    roots we also cache a summary of each partition (timestamp range, tags, entry count) so queries can skip any
+    partition that can't contain a match.
+    """
+
+    INDEX_FILENAME = "index.json"
+    PARTITIONS_FILENAME = "partitions.json"
+
+    def __init__(self, root_dirpath):
+        self.root_dirpath = root_dirpath
+        cache_dirpath = get_root_cache_dirpath(root_dirpath)
+        self.index_filepath = os.path.join(cache_dirpath, self.INDEX_FILENAME)
+        self.partitions_filepath = os.path.join(cache_dirpath, self.PARTITIONS_FILENAME)
+
+    def _load_top_level(self):
+        dir_mtime_ns = os.stat(self.root_dirpath).st_mtime_ns
+        cached_index = read_json_cache(self.index_filepath)
+        if cached_index is not None and cached_index["dir_mtime_ns"] == dir_mtime_ns:
+            return cached_index
+        filenames, subdirnames = scan_directory(self.root_dirpath)
+        index = {
+            "dir_mtime_ns": dir_mtime_ns,
+            "filenames": filenames,
+            "year_dirnames": sorted(dirname for dirname in subdirnames if PARTITION_YEAR_REGEX.fullmatch(dirname)),
+        }
+        write_json_cache(self.index_filepath, index)
+        return index
+
+    def load_filenames(self):
+        """
+        Returns the filenames of the entries directly in the root (i.e. not in partitions)
+        """
+        return self._load_top_level()["filenames"]
+
+    def load_dirpath_filenames(self, since=None, until=None, tag=None):
+        """
+        Returns [(dirpath, filenames)] for the root and every partition that could hold entries created in
+        [since, until) with the given tag (None meaning no constraint); entries directly in the root are always
+        included, since they're undated or not yet partitioned
+        """
+        top_level_index = self._load_top_level()
+        results = [(self.root_dirpath, top_level_index["filenames"])]
+        if len(top_level_index["year_dirnames"]) == 0:
+            return results
+
+        partition_summaries = read_json_cache(self.partitions_filepath) or {}
+        summaries_changed = False
+        for year_dirname in top_level_index["year_dirnames"]:
+            year = int(year_dirname)
+            if not _ranges_overlap(datetime.datetime(year, 1, 1), datetime.datetime(year + 1, 1, 1), since, until):
+                continue
+            year_dirpath = os.path.join(self.root_dirpath, year_dirname)
+            _, month_dirnames = scan_directory(year_dirpath)
+            for month_dirname in sorted(month_dirnames):
+                if not PARTITION_MONTH_REGEX.fullmatch(month_dirname):
+                    continue
+                month_start = datetime.datetime(year, int(month_dirname), 1)
+                next_month_start = datetime.datetime(year + int(month_dirname) // 12, int(month_dirname) % 12 + 1, 1)
+                if not _ranges_overlap(month_start, next_month_start, since, until):
+                    continue
+
+                partition_key = "%s/%s" % (year_dirname, month_dirname)
+                partition_dirpath = os.path.join(year_dirpath, month_dirname)
+                summary = partition_summaries.get(partition_key)
+                dir_mtime_ns = os.stat(partition_dirpath).st_mtime_ns
+                if summary is None or summary["dir_mtime_ns"] != dir_mtime_ns:
+                    summary = _summarize_partition(partition_dirpath, dir_mtime_ns)
+                    partition_summaries[partition_key] = summary
+                    summaries_changed = True
+
+                if summary["count"] == 0:
+                    continue
+                # Entries can be misfiled, so the partition's actual timestamp range is what decides, not its name
+                min_timestamp = datetime.datetime.fromisoformat(summary["min_timestamp"])
+                max_timestamp = datetime.datetime.fromisoformat(summary["max_timestamp"])
+                if not _ranges_overlap(min_timestamp, max_timestamp + datetime.timedelta(seconds=1), since, until):
+                    continue
+                if tag is not None and tag not in summary["tags"]:
+                    continue
+                results.append((partition_dirpath, summary["filenames"]))
+
+        if summaries_changed:
+            write_json_cache(self.partitions_filepath, partition_summaries)
+        return results
+
+    def stat_listed_dirpaths(self, dirpaths):
+        """
+        Returns {dirpath: mtime_ns} for those of the directories that are the root or one of its partitions, to be
+        taken right before changing them and handed to record_renames afterwards
+        """
+        dir_mtime_ns = {}
+        for dirpath in set(dirpaths):
+            if not is_root_or_partition_dirpath(self.root_dirpath, dirpath):
+                continue
+            try:
+                dir_mtime_ns[os.path.abspath(dirpath)] = os.stat(dirpath).st_mtime_ns
+            except OSError:
+                pass
+        return dir_mtime_ns
+
+    def record_renames(self, renames, dir_mtime_ns_before):
+        """
+        Applies completed (src filepath, dst filepath) renames (a src of None meaning the file was created) to the
+        cached listings of the root and its partitions, so they don't have to be rescanned. A listing is only updated
+        if it was current right before the renames, per dir_mtime_ns_before (see stat_listed_dirpaths); otherwise the
+        next load rescans it as usual.
+        """
+        removed_filenames = defaultdict(set)    # dirpath -> filenames
+        added_filenames = defaultdict(list)
+        for src, dst in renames:
+            if src is not None and os.path.abspath(os.path.dirname(src)) in dir_mtime_ns_before:
+                removed_filenames[os.path.abspath(os.path.dirname(src))].add(os.path.basename(src))
+            if os.path.abspath(os.path.dirname(dst)) in dir_mtime_ns_before:
+                added_filenames[os.path.abspath(os.path.dirname(dst))].append(os.path.basename(dst))
+
+        root_dirpath = os.path.abspath(self.root_dirpath)
+        partition_summaries = None
+        for dirpath in removed_filenames.keys() | added_filenames.keys():
+            if dirpath == root_dirpath:
+                cached_index = read_json_cache(self.index_filepath)
+                if cached_index is None or cached_index["dir_mtime_ns"] != dir_mtime_ns_before[dirpath]:
+                    continue
+                cached_index["filenames"] = _apply_filename_changes(cached_index["filenames"], removed_filenames[dirpath], added_filenames[dirpath])
+                cached_index["dir_mtime_ns"] = os.stat(dirpath).st_mtime_ns
+                write_json_cache(self.index_filepath, cached_index)
+                continue
+
+            if partition_summaries is None:
+                partition_summaries = read_json_cache(self.partitions_filepath) or {}
+            year_dirpath, month_dirname = os.path.split(dirpath)
+            partition_key = "%s/%s" % (os.path.basename(year_dirpath), month_dirname)
+            summary = partition_summaries.get(partition_key)
+            if summary is None or summary["dir_mtime_ns"] != dir_mtime_ns_before[dirpath]:
+                continue
+            filenames = _apply_filename_changes(summary["filenames"], removed_filenames[dirpath], added_filenames[dirpath])
+            partition_summaries[partition_key] = _summarize_filenames(filenames, os.stat(dirpath).st_mtime_ns)
+        if partition_summaries is not None:
+            write_json_cache(self.partitions_filepath, partition_summaries)
+
+    def record_created_filename(self, filename, dir_mtime_ns_before):
+        """
+        Adds a file we just created in the root to the cached listing, so it doesn't have to be rescanned. Only done if
+        the cache was current right before the creation; otherwise the next load rescans as usual.
+        """
+        self.record_renames([(None, os.path.join(self.root_dirpath, filename))], {os.path.abspath(self.root_dirpath): dir_mtime_ns_before})
+
+class StageProfiler:
+    """
+    Records wall time and tracemalloc allocation stats for each named stage of a command, so slow runs can be
+    pinned on the mount, parsing, or rendering. Does nothing unless enabled.
+    """
+
+    def __init__(self, enabled, dump_filepath=None):
+        self.enabled = enabled
+        self.dump_filepath = dump_filepath
+        self._stage_stats = []     # (name, wall secs, net allocated blocks, net allocated bytes, peak bytes)
+        self._profiler = None
+
+    def start(self):
+        if not self.enabled:
+            return
+        tracemalloc.start()
+        if self.dump_filepath is not None:
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        if not self.enabled:
+            yield
+            return
+
+        # Snapshots are slow, so they're taken outside the timed region
+        before_snapshot = tracemalloc.take_snapshot()
+        tracemalloc.reset_peak()
+        start_bytes, _ = tracemalloc.get_traced_memory()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            wall_secs = time.perf_counter() - start
+            _, peak_bytes = tracemalloc.get_traced_memory()
+            stat_diffs = tracemalloc.take_snapshot().compare_to(before_snapshot, 'filename')
+            self._stage_stats.append((
+                name,
+                wall_secs,
+                sum(stat_diff.count_diff for stat_diff in stat_diffs),
+                sum(stat_diff.size_diff for stat_diff in stat_diffs),
+                peak_bytes - start_bytes,
+            ))
+
+    def finish(self):
+        if not self.enabled:
+            return
+        if self._profiler is not None:
+            self._profiler.disable()
+            self._profiler.dump_stats(self.dump_filepath)
+        tracemalloc.stop()
+
+        print("%-10s %10s %12s %12s %12s" % ("stage", "wall_ms", "net_blocks", "net_KiB", "peak_KiB"), file=sys.stderr)
+        for name, wall_secs, net_blocks, net_bytes, peak_bytes in self._stage_stats:
+            print("%-10s %10.2f %12d %12.1f %12.1f" % (name, wall_secs * 1000, net_blocks, net_bytes / 1024, peak_bytes / 1024), file=sys.stderr)
+        if self._profiler is not None:
+            print("Wrote cProfile stats to %s" % self.dump_filepath, file=sys.stderr)
+
+# Helper Functions ====================================================================================================
+def scan_journal_filenames(journal_dirpath):
+    return [filename for filename in os.listdir(journal_dirpath) if os.path.isfile(os.path.join(journal_dirpath, filename))]
+
+def scan_directory(dirpath):
+    """
+    Returns (filenames, non-hidden subdirectory names) in one pass; scandir's cached file types save a stat per file
+    """
+    filenames = []
+    subdirnames = []
+    with os.scandir(dirpath) as dir_entries:
+        for dir_entry in dir_entries:
+            if dir_entry.is_file():
+                filenames.append(dir_entry.name)
+            elif dir_entry.is_dir() and not dir_entry.name.startswith("."):
+                subdirnames.append(dir_entry.name)
+    return filenames, subdirnames
+
+def stat_root_entries(root_dirpath):
+    """
+    Returns {filepath: (size, mtime_ns)} for every entry in the root and its partitions, for caches that are keyed by
+    path and invalidated when an entry's size or mtime changes
+    """
+    entry_stats = {}
+    for dirpath, filenames in RootIndex(root_dirpath).load_dirpath_filenames():
+        for filename in filenames:
+            filepath = os.path.join(dirpath, filename)
+            try:
+                stat = os.stat(filepath)
+            except OSError:
+                continue
+            entry_stats[filepath] = (stat.st_size, stat.st_mtime_ns)
+    return entry_stats
+
+def read_json_cache(filepath):
+    try:
+        with open(filepath) as cache_fp:
+            return json.load(cache_fp)
+    except (OSError, ValueError):
+        return None
+
+def write_json_cache(filepath, value):
+    """
+    Atomically replaces the file's contents. Each write goes through its own temp file, so concurrent writers (two
+    processes, or the same root listed twice) can't clobber each other's half-written file; the last replace wins.
+    """
+    dirpath = os.path.dirname(filepath)
+    os.makedirs(dirpath, exist_ok=True)
+    tmp_fd, tmp_filepath = tempfile.mkstemp(prefix=os.path.basename(filepath) + ".", suffix=".tmp", dir=dirpath)
+    try:
+        with os.fdopen(tmp_fd, "w") as tmp_fp:
+            json.dump(value, tmp_fp)
+        os.replace(tmp_filepath, filepath)
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.remove(tmp_filepath)
+        raise
+
+def _ranges_overlap(start, end, since, until):
+    """
+    Whether [start, end) overlaps [since, until), where a None since/until is unbounded
+    """
+    return (until is None or start < until) and (since is None or end > since)
+
+def _apply_filename_changes(filenames, removed_filenames, added_filenames):
+    return [filename for filename in filenames if filename not in removed_filenames] + added_filenames
+
+def _summarize_partition(partition_dirpath, dir_mtime_ns):
+    filenames, _ = scan_directory(partition_dirpath)
+    return _summarize_filenames(filenames, dir_mtime_ns)
+
+def _summarize_filenames(filenames, dir_mtime_ns):
+    entries = [EntryAndMetadata(filename) for filename in filenames]
+    timestamps = [entry.creation_timestamp for entry in entries]
+    return {
+        "dir_mtime_ns": dir_mtime_ns,
+        "filenames": filenames,
+        "count": len(entries),
+        "min_timestamp": min(timestamps).isoformat() if timestamps else None,
+        "max_timestamp": max(timestamps).isoformat() if timestamps else None,
+        "tags": sorted({tag for entry in entries for tag in entry.tags}),
+    }
+
+def get_partition_dirname(entry):
+    """
+    Returns the YYYY/MM partition an entry belongs in, or None for undated entries (which stay in the root)
+    """
+    if entry.creation_timestamp == EntryAndMetadata.MISSING_DATE_FORMAT_DATE:
+        return None
+    return os.path.join("%04d" % entry.creation_timestamp.year, "%02d" % entry.creation_timestamp.month)
+
+def is_root_or_partition_dirpath(root_dirpath, dirpath):
+    """
+    Whether dirpath is the root itself or one of its YYYY/MM partitions
+    """
+    root_dirpath = os.path.abspath(root_dirpath)
+    dirpath = os.path.abspath(dirpath)
+    if dirpath == root_dirpath:
+        return True
+    year_dirpath, month_dirname = os.path.split(dirpath)
+    parent_dirpath, year_dirname = os.path.split(year_dirpath)
+    return (
+        parent_dirpath == root_dirpath
+        and PARTITION_YEAR_REGEX.fullmatch(year_dirname) is not None
+        and PARTITION_MONTH_REGEX.fullmatch(month_dirname) is not None
+    )
+
+def get_root_cache_dirpath(root_dirpath):
+    root_hash = hashlib.sha1(os.path.abspath(root_dirpath).encode()).hexdigest()[:16]
+    return os.path.join(LOCAL_CACHE_DIRPATH, root_hash)
+
+def load_root_filenames(roots):
+    """
+    Returns [(dirpath, filenames)] across all the roots (and their partitions), scanning the roots concurrently so a
+    slow mount doesn't serialize behind the others
+    """
+    with ThreadPoolExecutor(max_workers=len(roots)) as pool:
+        return [
+            dirpath_filenames
+            for root_results in pool.map(lambda root: RootIndex(root).load_dirpath_filenames(), roots)
+            for dirpath_filenames in root_results
+        ]
+
+# '~' separates a filename's name/timestamp/tags and ',' separates its tags, so neither can appear inside one
+RESERVED_ENTRY_NAME_CHARS = {"~", ",", os.sep} | ({os.altsep} if os.altsep else set())
+
+def _check_entry_name_part(description, part):
+    reserved_chars = RESERVED_ENTRY_NAME_CHARS.intersection(part)
+    if len(reserved_chars) > 0:
+        raise ValueError("%s '%s' can't contain %s" % (description, part, " or ".join("'%s'" % char for char in sorted(reserved_chars))))
+
+def sanitize_entry_name(name_fragments):
+    """
+    Joins the fragments into an entry name the same way the shell's _sanitize_journal_name does, raising ValueError
+    if nothing is left or it contains a character that's reserved in filenames
+    """
+    name = " ".join(name_fragments).replace(" ", "-")
+    if name.endswith(".md"):
+        name = name[:-len(".md")]
+    if len(name) == 0:
+        raise ValueError("Entry name is empty")
+    _check_entry_name_part("Entry name", name)
+    return name
+
+def create_entry(root_dirpath, name_fragments, tags=(), entry_store=None, now=None):
+    """
+    Atomically creates a new, empty entry in the root, failing with FileExistsError rather than touching an existing
+    file. The entry is added to the entry store (if given) and the root's cached listing, so neither needs a rescan.
+    """
+    if now is None:
+        now = datetime.datetime.now()
+    for tag in tags:
+        if len(tag) == 0:
+            raise ValueError("Tags can't be empty")
+        _check_entry_name_part("Tag", tag)
+    filename = "%s~%s~%s.md" % (
+        sanitize_entry_name(name_fragments),
+        now.strftime(EntryAndMetadata.FILENAME_DATE_FMTS[0]),
+        ",".join(sorted(tags)),
+    )
+
+    dir_mtime_ns_before = os.stat(root_dirpath).st_mtime_ns
+    os.close(os.open(os.path.join(root_dirpath, filename), os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644))
+    RootIndex(root_dirpath).record_created_filename(filename, dir_mtime_ns_before)
+
+    entry = EntryAndMetadata(filename, root_dirpath)
+    if entry_store is not None:
+        entry_store.add(entry)
+    return entry
+
+def load_entries(profiler=None, roots=None):
+    if profiler is None:
+        profiler = StageProfiler(enabled=False)
+    if roots is None:
+        roots = JOURNAL_ROOTS
+    with profiler.stage("scan"):
+        root_filenames = load_root_filenames(roots)
+    with profiler.stage("parse"):
+        entries = [ EntryAndMetadata(filename, dirpath) for dirpath, filenames in root_filenames for filename in filenames]
+    with profiler.stage("index"):
+        return EntryStore(entries)
+
+def _make_entry_filter(predicate, since, until, tag):
+    def matches(entry):
+        if since is not None and entry.creation_timestamp < since:
+            return False
+        if until is not None and entry.creation_timestamp >= until:
+            return False
+        if tag is not None and tag not in entry.tags:
+            return False
+        return predicate is None or predicate(entry)
+    return matches
+
+def load_sorted_entry_streams(roots, entry_sort_type, sort_reverse, predicate=None, since=None, until=None, tag=None):
+    """
+    Returns one iterator per root over that root's entries, already sorted; each root is scanned, parsed, and sorted
+    on its own thread. Entries are limited to those matching the predicate, created in [since, until), and having
+    the tag (None meaning no constraint); the latter three also let partitioned roots skip whole partitions.
+    """
+    sort_key = ENTRY_SORTING_FUNCS[entry_sort_type]
+    matches = _make_entry_filter(predicate, since, until, tag)
+
+    def load_sorted_root(root):
+        entries = (
+            EntryAndMetadata(filename, dirpath)
+            for dirpath, filenames in RootIndex(root).load_dirpath_filenames(since, until, tag)
+            for filename in filenames
+        )
+        return sorted(filter(matches, entries), key=sort_key, reverse=sort_reverse)
+
+    # Deliberately not a 'with' block, which would wait for every root before we could yield anything
+    pool = ThreadPoolExecutor(max_workers=len(roots))
+    futures = [pool.submit(load_sorted_root, root) for root in roots]
+    pool.shutdown(wait=False)
+
+    def stream_from_future(future):
+        yield from future.result()
+    return [stream_from_future(future) for future in futures]
+
+def merge_entry_streams(streams, entry_sort_type, sort_reverse):
+    """
+    Lazily k-way merges already-sorted entry streams with a heap, rather than concatenating and re-sorting
+    """
+    return heapq.merge(*streams, key=ENTRY_SORTING_FUNCS[entry_sort_type], reverse=sort_reverse)
+
+TIMESTAMP_SORT = "DATE"
+ENTRY_NAME_SORT = "NAME"
+ENTRY_SORTING_FUNCS = {
+    TIMESTAMP_SORT: lambda entry_and_metadata: entry_and_metadata.creation_timestamp,
+    ENTRY_NAME_SORT: lambda entry_and_metadata: entry_and_metadata.pseudo_name,
+}
+
+def load_profiled_entry_streams(profiler, roots, entry_sort_type, sort_reverse, predicate=None, since=None, until=None, tag=None):
+    """
+    Same result as load_sorted_entry_streams, but loads the roots one after another in separate scan/parse/query
+    stages so the profiler can say which one is slow (the concurrent version interleaves them all across threads)
+    """
+    with profiler.stage("scan"):
+        root_dirpath_filenames = [RootIndex(root).load_dirpath_filenames(since, until, tag) for root in roots]
+    with profiler.stage("parse"):
+        root_entries = [
+            [EntryAndMetadata(filename, dirpath) for dirpath, filenames in dirpath_filenames for filename in filenames]
+            for dirpath_filenames in root_dirpath_filenames
+        ]
+    with profiler.stage("query"):
+        matches = _make_entry_filter(predicate, since, until, tag)
+        sort_key = ENTRY_SORTING_FUNCS[entry_sort_type]
+        return [sorted(filter(matches, entries), key=sort_key, reverse=sort_reverse) for entries in root_entries]
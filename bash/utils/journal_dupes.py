@@ -0,0 +1,265 @@
+"""
+Near-duplicate detection for journal entries (e.g. the same checklist template instantiated over and over)
+
+Each entry's body is broken into overlapping word shingles and summarised by a MinHash signature, whose fraction of
+matching slots between two entries estimates the Jaccard similarity of their shingle sets. Rather than comparing
+every pair, signatures are cut into bands and entries are bucketed by each band's values (locality-sensitive
+hashing): only entries sharing a bucket become candidate pairs, which keeps the whole thing near-linear.
+
+Signatures are cached in a SQLite database in each root's local cache dir, keyed by path and invalidated by
+mtime/size, so only new or changed entries are re-read. Signing is vectorised with NumPy when it's installed, with
+a (much slower, but identical) pure-Python fallback.
+"""
+
+import os
+import re
+import zlib
+import array
+import random
+import sqlite3
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+import journal_core
+
+FINGERPRINTS_DB_FILENAME = "fingerprints.sqlite3"
+
+READ_BATCH_SIZE = 64
+
+SHINGLE_NUM_WORDS = 3
+
+# 20 bands of 3 rows put the LSH threshold at (1/20) ** (1/3) ~= 0.37: a pair with similarity 0.6 shares a bucket
+# 99% of the time, while unrelated pairs almost never do
+NUM_BANDS = 20
+ROWS_PER_BAND = 3
+NUM_PERMUTATIONS = NUM_BANDS * ROWS_PER_BAND
+
+# Each "permutation" is a multiply-shift hash: the top 32 bits of (a * x + b) mod 2^64, with a odd. Unlike the
+# textbook (a * x + b) mod p, it needs no division, which is most of the cost of signing in NumPy.
+UINT64_MASK = (1 << 64) - 1
+HASH_SHIFT = 32
+
+# The permutations must be the same across runs, or cached signatures would be meaningless
+_permutation_rng = random.Random(0x6a6f75726e616c)
+PERMUTATION_A = [_permutation_rng.getrandbits(64) | 1 for _ in range(NUM_PERMUTATIONS)]
+PERMUTATION_B = [_permutation_rng.getrandbits(64) for _ in range(NUM_PERMUTATIONS)]
+if numpy is not None:
+    _permutation_a_array = numpy.array(PERMUTATION_A, dtype=numpy.uint64)[:, None]
+    _permutation_b_array = numpy.array(PERMUTATION_B, dtype=numpy.uint64)[:, None]
+
+# Shingle hashes signed per batch of NumPy operations; the permuted matrix is NUM_PERMUTATIONS uint64s per hash, so
+# this bounds it at ~100MB however long the entries are
+SIGN_CHUNK_NUM_HASHES = 200000
+
+WORD_REGEX = re.compile(r"\w+")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS signatures (
+    path TEXT PRIMARY KEY,
+    mtime_ns INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    signature BLOB
+);
+"""
+
+def get_shingle_hashes(text):
+    """
+    Returns the set of 32-bit hashes of the text's overlapping SHINGLE_NUM_WORDS-word shingles (or of its words, if
+    it's shorter than a shingle)
+    """
+    words = WORD_REGEX.findall(text.lower())
+    if len(words) < SHINGLE_NUM_WORDS:
+        shingles = words
+    else:
+        shingles = (" ".join(words[idx:idx + SHINGLE_NUM_WORDS]) for idx in range(len(words) - SHINGLE_NUM_WORDS + 1))
+    # crc32 rather than hash(), which is salted per process
+    return {zlib.crc32(shingle.encode()) for shingle in shingles}
+
+def _chunk_by_num_hashes(shingle_hash_sets):
+    """
+    Yields consecutive runs of the sets holding at most SIGN_CHUNK_NUM_HASHES hashes between them (or a single set, if
+    it's bigger than that by itself)
+    """
+    chunk = []
+    chunk_num_hashes = 0
+    for shingle_hashes in shingle_hash_sets:
+        if len(chunk) > 0 and chunk_num_hashes + len(shingle_hashes) > SIGN_CHUNK_NUM_HASHES:
+            yield chunk
+            chunk = []
+            chunk_num_hashes = 0
+        chunk.append(shingle_hashes)
+        chunk_num_hashes += len(shingle_hashes)
+    if len(chunk) > 0:
+        yield chunk
+
+def compute_signatures(shingle_hash_sets):
+    """
+    Returns the MinHash signature of each non-empty set of shingle hashes, as NUM_PERMUTATIONS packed uint32s
+    """
+    if numpy is None:
+        return [
+            array.array("I", [
+                min(((a * shingle_hash + b) & UINT64_MASK) >> HASH_SHIFT for shingle_hash in shingle_hashes)
+                for a, b in zip(PERMUTATION_A, PERMUTATION_B)
+            ]).tobytes()
+            for shingle_hashes in shingle_hash_sets
+        ]
+
+    # Entries are signed in chunks (so the NUM_PERMUTATIONS x shingles matrix stays small) with every entry's
+    # shingles laid end to end, so each chunk takes a handful of NumPy calls rather than a few per entry
+    signatures = []
+    for chunk in _chunk_by_num_hashes(shingle_hash_sets):
+        lengths = numpy.fromiter((len(shingle_hashes) for shingle_hashes in chunk), dtype=numpy.int64, count=len(chunk))
+        hashes = numpy.fromiter(
+            (shingle_hash for shingle_hashes in chunk for shingle_hash in shingle_hashes),
+            dtype=numpy.uint64,
+            count=int(lengths.sum()),
+        )
+        # uint64 arithmetic wraps, same as the '& UINT64_MASK' in the pure-Python version
+        permuted = (_permutation_a_array * hashes + _permutation_b_array) >> numpy.uint64(HASH_SHIFT)
+        offsets = numpy.concatenate(([0], numpy.cumsum(lengths)[:-1]))
+        chunk_signatures = numpy.minimum.reduceat(permuted, offsets, axis=1).T.astype(numpy.uint32)
+        signatures.extend(row.tobytes() for row in chunk_signatures)
+    return signatures
+
+def _read_shingle_hashes(filepath):
+    try:
+        with open(filepath, encoding="utf-8", errors="replace") as entry_fp:
+            shingle_hashes = get_shingle_hashes(entry_fp.read())
+    except OSError:
+        return None
+    # Empty entries would all look identical to each other, which isn't useful
+    if len(shingle_hashes) == 0:
+        return None
+    return shingle_hashes
+
+class FingerprintIndex:
+    """
+    Cached MinHash signatures for one journal root
+    """
+
+    def __init__(self, root_dirpath):
+        self.root_dirpath = root_dirpath
+        db_filepath = os.path.join(journal_core.get_root_cache_dirpath(root_dirpath), FINGERPRINTS_DB_FILENAME)
+        os.makedirs(os.path.dirname(db_filepath), exist_ok=True)
+        self._db = sqlite3.connect(db_filepath)
+        self._db.executescript(SCHEMA)
+
+    def close(self):
+        self._db.close()
+
+    def load_signatures(self):
+        """
+        Returns {filepath: signature bytes} for every non-empty entry in the root, re-signing only entries that are
+        new or whose mtime/size changed
+        """
+        current_stats = journal_core.stat_root_entries(self.root_dirpath)
+
+        signatures = {}
+        cached_stats = {}
+        for path, mtime_ns, size, signature_bytes in self._db.execute("SELECT path, mtime_ns, size, signature FROM signatures"):
+            cached_stats[path] = (size, mtime_ns)
+            if signature_bytes is not None and current_stats.get(path) == (size, mtime_ns):
+                signatures[path] = signature_bytes
+        removed_filepaths = cached_stats.keys() - current_stats.keys()
+        changed_filepaths = [filepath for filepath, stats in current_stats.items() if cached_stats.get(filepath) != stats]
+
+        # Batched so that handing out work doesn't cost more than the reads themselves on a fast disk
+        filepath_batches = [changed_filepaths[idx:idx + READ_BATCH_SIZE] for idx in range(0, len(changed_filepaths), READ_BATCH_SIZE)]
+        with ThreadPoolExecutor(max_workers=journal_core.ENTRY_READ_MAX_WORKERS) as pool:
+            changed_shingle_hashes = [
+                shingle_hashes
+                for batch_shingle_hashes in pool.map(lambda batch: [_read_shingle_hashes(filepath) for filepath in batch], filepath_batches)
+                for shingle_hashes in batch_shingle_hashes
+            ]
+        signable = [(filepath, shingle_hashes) for filepath, shingle_hashes in zip(changed_filepaths, changed_shingle_hashes) if shingle_hashes is not None]
+        signatures.update(zip(
+            [filepath for filepath, _ in signable],
+            compute_signatures([shingle_hashes for _, shingle_hashes in signable]),
+        ))
+        changed_rows = [
+            (filepath, current_stats[filepath][1], current_stats[filepath][0], signatures.get(filepath))
+            for filepath in changed_filepaths
+        ]
+
+        with self._db:
+            self._db.executemany("DELETE FROM signatures WHERE path = ?", [(filepath,) for filepath in removed_filepaths])
+            self._db.executemany("INSERT OR REPLACE INTO signatures VALUES (?, ?, ?, ?)", changed_rows)
+        return signatures
+
+def estimate_similarity(signature_a, signature_b):
+    return sum(1 for a, b in zip(array.array("I", signature_a), array.array("I", signature_b)) if a == b) / NUM_PERMUTATIONS
+
+def _find_candidate_pairs_numpy(signature_matrix):
+    """
+    Returns the (idx_a, idx_b) pairs (idx_a < idx_b) of rows sharing at least one band, as two arrays
+    """
+    num_rows = len(signature_matrix)
+    pair_keys = []
+    for band_idx in range(NUM_BANDS):
+        band = signature_matrix[:, band_idx * ROWS_PER_BAND:(band_idx + 1) * ROWS_PER_BAND]
+        # Sorting the rows by the band's values puts each bucket in one contiguous run
+        order = numpy.lexsort(band.T[::-1])
+        sorted_band = band[order]
+        same_as_previous = (sorted_band[1:] == sorted_band[:-1]).all(axis=1)
+        run_starts = numpy.flatnonzero(numpy.concatenate(([True], ~same_as_previous)))
+        run_lengths = numpy.diff(numpy.append(run_starts, num_rows))
+        # Buckets of two are by far the most common, so they're done all at once
+        pair_starts = run_starts[run_lengths == 2]
+        pair_keys.append(numpy.minimum(order[pair_starts], order[pair_starts + 1]) * num_rows + numpy.maximum(order[pair_starts], order[pair_starts + 1]))
+        for run_start, run_length in zip(run_starts[run_lengths > 2].tolist(), run_lengths[run_lengths > 2].tolist()):
+            bucket = numpy.sort(order[run_start:run_start + run_length])
+            idxs_a, idxs_b = numpy.triu_indices(run_length, k=1)
+            pair_keys.append(bucket[idxs_a] * num_rows + bucket[idxs_b])
+    return numpy.divmod(numpy.unique(numpy.concatenate(pair_keys)), num_rows)
+
+def _find_candidate_pairs_python(signature_list):
+    candidate_pairs = set()
+    for band_idx in range(NUM_BANDS):
+        band_slice = slice(band_idx * ROWS_PER_BAND * 4, (band_idx + 1) * ROWS_PER_BAND * 4)
+        buckets = defaultdict(list)
+        for idx, signature in enumerate(signature_list):
+            buckets[signature[band_slice]].append(idx)
+        for bucket in buckets.values():
+            for position, idx_a in enumerate(bucket):
+                for idx_b in bucket[position + 1:]:
+                    candidate_pairs.add((idx_a, idx_b))
+    return candidate_pairs
+
+def find_near_duplicates(signatures, min_similarity):
+    """
+    Returns [(similarity, filepath, filepath)] for every pair of entries whose estimated Jaccard similarity is at
+    least min_similarity, most similar first
+    """
+    filepaths = list(signatures.keys())
+    signature_list = list(signatures.values())
+    results = []
+    if numpy is not None and len(filepaths) > 0:
+        signature_matrix = numpy.frombuffer(b"".join(signature_list), dtype=numpy.uint32).reshape(len(filepaths), NUM_PERMUTATIONS)
+        idxs_a, idxs_b = _find_candidate_pairs_numpy(signature_matrix)
+        similarities = (signature_matrix[idxs_a] == signature_matrix[idxs_b]).sum(axis=1) / NUM_PERMUTATIONS
+        is_similar = similarities >= min_similarity
+        for similarity, idx_a, idx_b in zip(similarities[is_similar].tolist(), idxs_a[is_similar].tolist(), idxs_b[is_similar].tolist()):
+            results.append((similarity, filepaths[idx_a], filepaths[idx_b]))
+    else:
+        for idx_a, idx_b in _find_candidate_pairs_python(signature_list):
+            similarity = estimate_similarity(signature_list[idx_a], signature_list[idx_b])
+            if similarity >= min_similarity:
+                results.append((similarity, filepaths[idx_a], filepaths[idx_b]))
+    results.sort(key=lambda result: (-result[0], result[1], result[2]))
+    return results
+
+def load_signatures(roots):
+    signatures = {}
+    for root in roots:
+        fingerprint_index = FingerprintIndex(root)
+        try:
+            signatures.update(fingerprint_index.load_signatures())
+        finally:
+            fingerprint_index.close()
+    return signatures
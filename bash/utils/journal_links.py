@@ -0,0 +1,155 @@
+"""
+Persistent link graph over journal entries, for answering "what does this link to" and "what links here" without
+grepping the whole journal
+
+Links are markdown links ('[text](some-entry~2021-01-01~tag.md)') and wiki links ('[[some-entry]]') to local files.
+Targets are resolved through EntryAndMetadata.pseudo_name, so a link keeps pointing at an entry even after its
+timestamp or tags change. Each root gets a SQLite database in its local cache dir with indexes on both ends of every
+link, so a query costs O(degree); refreshing it only re-reads the entries whose mtime or size changed.
+"""
+
+import os
+import re
+import sqlite3
+from urllib.parse import unquote
+from concurrent.futures import ThreadPoolExecutor
+
+import journal_core
+
+LINKS_DB_FILENAME = "links.sqlite3"
+
+MARKDOWN_LINK_REGEX = re.compile(r"\[[^\]]*\]\(<?([^)\s>]+)>?(?:\s+\"[^\"]*\")?\)")
+WIKI_LINK_REGEX = re.compile(r"\[\[([^\]|#]+)(?:[|#][^\]]*)?\]\]")
+URL_SCHEME_REGEX = re.compile(r"[a-zA-Z][a-zA-Z0-9+.-]*:")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    pseudo_name TEXT NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    size INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS files_by_pseudo_name ON files (pseudo_name);
+CREATE TABLE IF NOT EXISTS links (
+    source_path TEXT NOT NULL,
+    target_pseudo_name TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS links_by_source ON links (source_path);
+CREATE INDEX IF NOT EXISTS links_by_target ON links (target_pseudo_name);
+"""
+
+def normalize_link_target(target):
+    """
+    Turns a link target (path, filename, or bare wiki name) into the pseudo_name of the entry it refers to, or None
+    if it isn't a link to another entry
+    """
+    target = target.strip()
+    if not target or target.startswith("#") or URL_SCHEME_REGEX.match(target):
+        return None
+    filename = os.path.basename(unquote(target.split("#", 1)[0]))
+    if not filename:
+        return None
+    if not os.path.splitext(filename)[1]:
+        filename += ".md"
+    return journal_core.EntryAndMetadata(filename).pseudo_name
+
+def extract_link_targets(text):
+    targets = set()
+    for regex in (MARKDOWN_LINK_REGEX, WIKI_LINK_REGEX):
+        for raw_target in regex.findall(text):
+            pseudo_name = normalize_link_target(raw_target)
+            if pseudo_name is not None:
+                targets.add(pseudo_name)
+    return targets
+
+def _read_link_targets(filepath):
+    try:
+        with open(filepath, encoding="utf-8", errors="replace") as entry_fp:
+            return extract_link_targets(entry_fp.read())
+    except OSError:
+        return set()
+
+class LinkIndex:
+    """
+    The link graph for one journal root
+    """
+
+    def __init__(self, root_dirpath):
+        self.root_dirpath = root_dirpath
+        db_filepath = os.path.join(journal_core.get_root_cache_dirpath(root_dirpath), LINKS_DB_FILENAME)
+        os.makedirs(os.path.dirname(db_filepath), exist_ok=True)
+        # Refreshes run on a worker thread, but never more than one thread at a time per index
+        self._db = sqlite3.connect(db_filepath, check_same_thread=False)
+        self._db.executescript(SCHEMA)
+
+    def close(self):
+        self._db.close()
+
+    def refresh(self):
+        """
+        Brings the graph up to date with the root, re-reading only entries that are new or whose mtime/size changed
+        """
+        current_stats = journal_core.stat_root_entries(self.root_dirpath)
+        indexed_stats = {
+            path: (size, mtime_ns)
+            for path, mtime_ns, size in self._db.execute("SELECT path, mtime_ns, size FROM files")
+        }
+        removed_filepaths = indexed_stats.keys() - current_stats.keys()
+        changed_filepaths = [filepath for filepath, stats in current_stats.items() if indexed_stats.get(filepath) != stats]
+
+        with ThreadPoolExecutor(max_workers=journal_core.ENTRY_READ_MAX_WORKERS) as pool:
+            changed_targets = list(pool.map(_read_link_targets, changed_filepaths))
+
+        with self._db:
+            stale_filepaths = [(filepath,) for filepath in list(removed_filepaths) + changed_filepaths]
+            self._db.executemany("DELETE FROM files WHERE path = ?", stale_filepaths)
+            self._db.executemany("DELETE FROM links WHERE source_path = ?", stale_filepaths)
+            for filepath, targets in zip(changed_filepaths, changed_targets):
+                size, mtime_ns = current_stats[filepath]
+                pseudo_name = journal_core.EntryAndMetadata(os.path.basename(filepath)).pseudo_name
+                self._db.execute("INSERT INTO files VALUES (?, ?, ?, ?)", (filepath, pseudo_name, mtime_ns, size))
+                self._db.executemany("INSERT INTO links VALUES (?, ?)", [(filepath, target) for target in targets])
+
+    def get_filepaths(self, pseudo_name):
+        return [row[0] for row in self._db.execute("SELECT path FROM files WHERE pseudo_name = ?", (pseudo_name,))]
+
+    def get_link_targets(self, source_filepath):
+        return [row[0] for row in self._db.execute("SELECT target_pseudo_name FROM links WHERE source_path = ?", (source_filepath,))]
+
+    def get_backlink_sources(self, target_pseudo_name):
+        return [row[0] for row in self._db.execute("SELECT source_path FROM links WHERE target_pseudo_name = ?", (target_pseudo_name,))]
+
+def open_link_indexes(roots, refresh=True):
+    link_indexes = [LinkIndex(root) for root in roots]
+    if refresh:
+        # Each root's refresh is dominated by its own mount's latency, so they overlap nicely
+        with ThreadPoolExecutor(max_workers=len(link_indexes)) as pool:
+            list(pool.map(lambda link_index: link_index.refresh(), link_indexes))
+    return link_indexes
+
+def get_links(link_indexes, entry_arg):
+    """
+    Returns (linked filepaths, unresolved target pseudo_names) for every entry matching entry_arg
+    """
+    pseudo_name = normalize_link_target(entry_arg)
+    targets = set()
+    for link_index in link_indexes:
+        for source_filepath in link_index.get_filepaths(pseudo_name):
+            targets.update(link_index.get_link_targets(source_filepath))
+
+    linked_filepaths = []
+    unresolved_targets = []
+    for target in sorted(targets):
+        target_filepaths = [filepath for link_index in link_indexes for filepath in link_index.get_filepaths(target)]
+        if len(target_filepaths) == 0:
+            unresolved_targets.append(target)
+        linked_filepaths.extend(target_filepaths)
+    return linked_filepaths, unresolved_targets
+
+def get_backlinks(link_indexes, entry_arg):
+    pseudo_name = normalize_link_target(entry_arg)
+    return sorted({
+        source_filepath
+        for link_index in link_indexes
+        for source_filepath in link_index.get_backlink_sources(pseudo_name)
+    })
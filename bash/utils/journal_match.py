@@ -0,0 +1,169 @@
+"""
+Ranked fuzzy matching of journal entries, reproducing what _fzf_select_journal_entry gets out of fzf's
+'--scheme=history --tiebreak=index' without running the fd | awk | sort pipeline first
+
+Every query token must match the entry's name or tags. Tokens score independently (so 'needle foo' ranks
+'needle-foo' and 'foo-needle' the same): a whole word in the name beats a word prefix, which beats a bare substring,
+and tags score a little less than the name. Failing all of those, a token whose characters appear in order in the
+name (fzf's fuzzy match, e.g. 'wkly' for 'weekly-review') still matches, but scores lowest. Ties go to the most
+recently created entry, just like fzf's index tiebreak does over the timestamp-sorted list, and then to whichever
+entry was given first.
+
+Scoring is vectorised with NumPy when it's installed, with a pure-Python fallback, and the top K come off a bounded
+heap (or a partition) instead of a full sort.
+"""
+
+import re
+import heapq
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+NAME_WORD_SCORE = 8
+NAME_PREFIX_SCORE = 6
+NAME_SUBSTRING_SCORE = 2
+TAG_SCORE = 4
+TAG_PREFIX_SCORE = 2
+NAME_SUBSEQUENCE_SCORE = 1
+
+# Must be larger than any possible timestamp (in seconds) so that score always dominates recency
+SCORE_WEIGHT = 1e11
+
+def _normalize_name(entry):
+    # Wrapping in delimiters lets '-word-' and '-prefix' checks find words at either end of the name
+    name = entry.pseudo_name.rsplit(".", 1)[0].lower()
+    return "-" + name.replace("_", "-").replace(" ", "-") + "-"
+
+def _normalize_tags(entry):
+    return "," + ",".join(tag.lower() for tag in entry.tags) + ","
+
+def _make_subsequence_regex(token):
+    """
+    Matches the token's characters in order, within one line. Skipping with '[^<next char>]*' rather than '.*?' finds
+    the same (leftmost) match without any backtracking.
+    """
+    return re.compile(re.escape(token[0]) + "".join("[^\n%s]*%s" % (re.escape(char), re.escape(char)) for char in token[1:]))
+
+
+class MatchIndex:
+    """
+    Precomputed matching data for a set of entries, so any number of queries can be scored against it
+    """
+
+    def __init__(self, entries):
+        self.entries = list(entries)
+        self._names = [_normalize_name(entry) for entry in self.entries]
+        self._tags = [_normalize_tags(entry) for entry in self.entries]
+        self._timestamps = [entry.creation_timestamp.timestamp() for entry in self.entries]
+        if numpy is not None:
+            self._names_array = numpy.array(self._names)
+            self._tags_array = numpy.array(self._tags)
+            self._timestamps_array = numpy.array(self._timestamps, dtype=numpy.float64)
+            # All the names in one string, so a subsequence search is a single pass of the regex engine over them
+            self._joined_names = "\n".join(self._names)
+            self._name_starts = numpy.cumsum([0] + [len(name) + 1 for name in self._names[:-1]])
+
+    def top_matches(self, query, k):
+        """
+        Returns up to k (entry, score) pairs for the query, best first
+        """
+        tokens = query.lower().split()
+        if numpy is not None and len(self.entries) > 0:
+            return self._top_matches_numpy(tokens, k)
+        return self._top_matches_python(tokens, k)
+
+    def _match_subsequence_numpy(self, token):
+        """
+        Returns which entries' names contain the token's characters in order
+        """
+        # A name's first match is all that counts, and matches can't run on into the next name
+        match_starts = [match.start() for match in _make_subsequence_regex(token).finditer(self._joined_names)]
+        matched = numpy.zeros(len(self.entries), dtype=bool)
+        matched[numpy.searchsorted(self._name_starts, match_starts, side="right") - 1] = True
+        return matched
+
+    def _top_matches_numpy(self, tokens, k):
+        find = numpy.char.find
+        # Each token narrows the candidates, so later (and the more expensive whole-word) checks run on fewer rows
+        candidate_idxs = numpy.arange(len(self.entries))
+        scores = numpy.zeros(len(self.entries), dtype=numpy.float64)
+        for token in tokens:
+            names = self._names_array[candidate_idxs]
+            tags = self._tags_array[candidate_idxs]
+            name_match = find(names, token) >= 0
+            tag_prefix_match = find(tags, "," + token) >= 0
+            matched = name_match | tag_prefix_match
+            name_subsequence_match = self._match_subsequence_numpy(token)[candidate_idxs] & ~matched
+            matched |= name_subsequence_match
+            candidate_idxs = candidate_idxs[matched]
+            names = names[matched]
+            tags = tags[matched]
+            name_match = name_match[matched]
+            tag_prefix_match = tag_prefix_match[matched]
+            name_subsequence_match = name_subsequence_match[matched]
+
+            name_prefix_match = find(names, "-" + token) >= 0
+            name_score = numpy.select(
+                [name_prefix_match & (find(names, "-" + token + "-") >= 0), name_prefix_match, name_match, name_subsequence_match],
+                [NAME_WORD_SCORE, NAME_PREFIX_SCORE, NAME_SUBSTRING_SCORE, NAME_SUBSEQUENCE_SCORE],
+                default=0,
+            )
+            tag_score = numpy.select(
+                [tag_prefix_match & (find(tags, "," + token + ",") >= 0), tag_prefix_match],
+                [TAG_SCORE, TAG_PREFIX_SCORE],
+                default=0,
+            )
+            scores[candidate_idxs] += numpy.maximum(name_score, tag_score)
+
+        if len(candidate_idxs) == 0:
+            return []
+        ranks = scores[candidate_idxs] * SCORE_WEIGHT + self._timestamps_array[candidate_idxs]
+        if len(candidate_idxs) > k:
+            # Everything tied with the kth best is kept, so the tiebreak below (not the partition) decides between them
+            kth_best_rank = numpy.partition(ranks, len(ranks) - k)[len(ranks) - k]
+            top_positions = numpy.flatnonzero(ranks >= kth_best_rank)
+        else:
+            top_positions = numpy.arange(len(candidate_idxs))
+        # candidate_idxs is ascending, so ties on rank go to the lowest entry index, same as the Python path
+        top_positions = top_positions[numpy.lexsort((top_positions, -ranks[top_positions]))][:k]
+        return [(self.entries[candidate_idxs[position]], int(scores[candidate_idxs[position]])) for position in top_positions]
+
+    def _score_python(self, idx, tokens, subsequence_regexes):
+        name = self._names[idx]
+        tags = self._tags[idx]
+        total_score = 0
+        for token, subsequence_regex in zip(tokens, subsequence_regexes):
+            if ("-" + token + "-") in name:
+                token_score = NAME_WORD_SCORE
+            elif ("-" + token) in name:
+                token_score = NAME_PREFIX_SCORE
+            elif token in name:
+                token_score = NAME_SUBSTRING_SCORE
+            elif subsequence_regex.search(name) is not None:
+                token_score = NAME_SUBSEQUENCE_SCORE
+            else:
+                token_score = 0
+            if token_score < TAG_SCORE:
+                if ("," + token + ",") in tags:
+                    token_score = TAG_SCORE
+                elif token_score < TAG_PREFIX_SCORE and ("," + token) in tags:
+                    token_score = TAG_PREFIX_SCORE
+            if token_score == 0:
+                return 0
+            total_score += token_score
+        return total_score
+
+    def _top_matches_python(self, tokens, k):
+        subsequence_regexes = [_make_subsequence_regex(token) for token in tokens]
+
+        def scored_candidates():
+            for idx in range(len(self.entries)):
+                score = self._score_python(idx, tokens, subsequence_regexes)
+                if score > 0 or len(tokens) == 0:
+                    # Negating the index breaks ties in favour of the lowest one, same as the NumPy path
+                    yield (score, self._timestamps[idx], -idx)
+
+        # nlargest keeps a heap of size k rather than sorting every candidate
+        return [(self.entries[-negated_idx], score) for score, _, negated_idx in heapq.nlargest(k, scored_candidates())]
@@ -0,0 +1,237 @@
+"""
+Packed single-file snapshot of a journal root, for whole-journal reads (stats, search, export) that would otherwise
+open thousands of small files on the sync mount
+
+A pack lives in the root's local cache dir and is laid out as:
+
+    header | body | body | ... | index | footer
+
+Bodies are stored raw or zlib-compressed. The index is zlib-compressed JSON mapping each entry's path relative to
+the root (just its filename in a flat root) to its body's offset/length, the size/mtime it was packed at, and the
+metadata EntryAndMetadata parses out of the filename. The fixed-size footer points at the index.
+
+Updating is append-only: bodies for new or changed entries are written over the old index, followed by a new index
+and footer, so unchanged bodies are never rewritten. The space held by superseded bodies is reclaimed by rewriting
+the whole pack once it makes up most of the file. Readers mmap the pack and slice raw bodies without copying.
+"""
+
+import os
+import json
+import mmap
+import zlib
+import struct
+from concurrent.futures import ThreadPoolExecutor
+
+import journal_core
+
+PACK_FILENAME = "journal_core.pack"
+
+HEADER_MAGIC = b"JPACK001"
+FOOTER_MAGIC = b"JPACKEND"
+FOOTER_STRUCT = struct.Struct(">QQ8s")    # index offset, index length, magic
+
+RAW_ENCODING = "raw"
+ZLIB_ENCODING = "zlib"
+
+# Once superseded bodies make up this much of the pack, it gets rewritten from scratch
+COMPACT_DEAD_FRACTION = 0.5
+
+def get_pack_filepath(root_dirpath):
+    return os.path.join(journal_core.get_root_cache_dirpath(root_dirpath), PACK_FILENAME)
+
+def _read_index(pack_fp):
+    """
+    Returns (index, index offset) from an open pack, or None if it's missing or corrupt
+    """
+    pack_fp.seek(0, os.SEEK_END)
+    pack_size = pack_fp.tell()
+    if pack_size < len(HEADER_MAGIC) + FOOTER_STRUCT.size:
+        return None
+    pack_fp.seek(0)
+    if pack_fp.read(len(HEADER_MAGIC)) != HEADER_MAGIC:
+        return None
+    pack_fp.seek(pack_size - FOOTER_STRUCT.size)
+    index_offset, index_length, footer_magic = FOOTER_STRUCT.unpack(pack_fp.read(FOOTER_STRUCT.size))
+    if footer_magic != FOOTER_MAGIC or index_offset + index_length + FOOTER_STRUCT.size != pack_size:
+        return None
+    pack_fp.seek(index_offset)
+    try:
+        return json.loads(zlib.decompress(pack_fp.read(index_length))), index_offset
+    except (zlib.error, ValueError):
+        return None
+
+def _read_body(filepath):
+    try:
+        with open(filepath, "rb") as entry_fp:
+            return entry_fp.read()
+    except OSError:
+        return None
+
+def _get_entry_metadata(entry):
+    return {
+        "filename": entry.filename,
+        "pseudo_name": entry.pseudo_name,
+        "creation_timestamp": entry.creation_timestamp.isoformat(),
+        "tags": sorted(entry.tags),
+    }
+
+class PackUpdateResult:
+    def __init__(self):
+        self.num_packed = 0
+        self.num_removed = 0
+        self.num_unchanged = 0
+        self.compacted = False
+
+def update_pack(root_dirpath, compress=True):
+    """
+    Brings the root's pack up to date, appending bodies only for entries that are new or whose size/mtime changed
+    """
+    result = PackUpdateResult()
+    current_stats = {
+        os.path.relpath(filepath, root_dirpath): entry_stats
+        for filepath, entry_stats in journal_core.stat_root_entries(root_dirpath).items()
+    }
+
+    pack_filepath = get_pack_filepath(root_dirpath)
+    os.makedirs(os.path.dirname(pack_filepath), exist_ok=True)
+    with open(pack_filepath, "a+b") as pack_fp:
+        loaded = _read_index(pack_fp)
+    index, index_offset = loaded if loaded is not None else ({"entries": {}, "dead_bytes": 0}, None)
+
+    packed_entries = index["entries"]
+    dead_bytes = index["dead_bytes"]
+    for relpath in packed_entries.keys() - current_stats.keys():
+        dead_bytes += packed_entries.pop(relpath)["length"]
+        result.num_removed += 1
+    changed_relpaths = [
+        relpath
+        for relpath, (size, mtime_ns) in current_stats.items()
+        if relpath not in packed_entries
+        or (packed_entries[relpath]["size"], packed_entries[relpath]["mtime_ns"]) != (size, mtime_ns)
+    ]
+    result.num_unchanged = len(current_stats) - len(changed_relpaths)
+
+    live_bytes = sum(packed_entry["length"] for packed_entry in packed_entries.values())
+    # Bodies about to be replaced are as good as dead already, and counting them now keeps a big rewrite of changed
+    # entries from being appended only to be compacted away on the next update
+    superseded_bytes = sum(packed_entries[relpath]["length"] for relpath in changed_relpaths if relpath in packed_entries)
+    if index_offset is None or dead_bytes + superseded_bytes > COMPACT_DEAD_FRACTION * (live_bytes + dead_bytes):
+        # Starting over means every body has to be (re)written, but unchanged ones can come out of the old pack
+        result.compacted = index_offset is not None
+        _rewrite_pack(root_dirpath, pack_filepath, packed_entries, changed_relpaths, current_stats, compress)
+    else:
+        with open(pack_filepath, "r+b") as pack_fp:
+            pack_fp.seek(index_offset)
+            pack_fp.truncate()
+            for relpath, body in _read_bodies(root_dirpath, changed_relpaths):
+                if body is None:
+                    continue
+                if relpath in packed_entries:
+                    dead_bytes += packed_entries[relpath]["length"]
+                packed_entries[relpath] = _write_body(pack_fp, root_dirpath, relpath, body, current_stats[relpath], compress)
+            _write_index(pack_fp, {"entries": packed_entries, "dead_bytes": dead_bytes})
+    result.num_packed = len(changed_relpaths)
+    return result
+
+def _read_bodies(root_dirpath, relpaths):
+    with ThreadPoolExecutor(max_workers=journal_core.ENTRY_READ_MAX_WORKERS) as pool:
+        bodies = pool.map(_read_body, [os.path.join(root_dirpath, relpath) for relpath in relpaths])
+        yield from zip(relpaths, bodies)
+
+def _write_body(pack_fp, root_dirpath, relpath, body, stats, compress):
+    encoding = RAW_ENCODING
+    stored_body = body
+    if compress:
+        compressed_body = zlib.compress(body)
+        # Tiny entries often don't shrink, and raw bodies are the ones readers can slice without copying
+        if len(compressed_body) < len(body):
+            encoding = ZLIB_ENCODING
+            stored_body = compressed_body
+    packed_entry = {
+        "offset": pack_fp.tell(),
+        "length": len(stored_body),
+        "encoding": encoding,
+        "size": stats[0],
+        "mtime_ns": stats[1],
+        "dirpath": os.path.dirname(relpath),
+    }
+    packed_entry.update(_get_entry_metadata(journal_core.EntryAndMetadata(os.path.basename(relpath))))
+    pack_fp.write(stored_body)
+    return packed_entry
+
+def _write_index(pack_fp, index):
+    index_offset = pack_fp.tell()
+    index_bytes = zlib.compress(json.dumps(index).encode())
+    pack_fp.write(index_bytes)
+    pack_fp.write(FOOTER_STRUCT.pack(index_offset, len(index_bytes), FOOTER_MAGIC))
+
+def _rewrite_pack(root_dirpath, pack_filepath, packed_entries, changed_relpaths, current_stats, compress):
+    tmp_filepath = pack_filepath + ".tmp"
+    new_entries = {}
+    old_pack = Pack(root_dirpath) if len(packed_entries) > 0 else None
+    try:
+        with open(tmp_filepath, "wb") as tmp_fp:
+            tmp_fp.write(HEADER_MAGIC)
+            changed_relpath_set = set(changed_relpaths)
+            for relpath in packed_entries:
+                if relpath not in changed_relpath_set:
+                    new_entries[relpath] = _write_body(tmp_fp, root_dirpath, relpath, bytes(old_pack.get_body(relpath)), current_stats[relpath], compress)
+            for relpath, body in _read_bodies(root_dirpath, changed_relpaths):
+                if body is not None:
+                    new_entries[relpath] = _write_body(tmp_fp, root_dirpath, relpath, body, current_stats[relpath], compress)
+            _write_index(tmp_fp, {"entries": new_entries, "dead_bytes": 0})
+    finally:
+        if old_pack is not None:
+            old_pack.close()
+    os.replace(tmp_filepath, pack_filepath)
+
+class Pack:
+    """
+    Read-only, mmapped view of a root's pack
+    """
+
+    def __init__(self, root_dirpath):
+        self.root_dirpath = root_dirpath
+        with open(get_pack_filepath(root_dirpath), "rb") as pack_fp:
+            loaded = _read_index(pack_fp)
+            if loaded is None:
+                raise ValueError("No valid pack for '%s'; run 'journal.py pack' first" % root_dirpath)
+            self._entries = loaded[0]["entries"]
+            self._mmap = mmap.mmap(pack_fp.fileno(), 0, access=mmap.ACCESS_READ)
+        self._view = memoryview(self._mmap)
+
+    def close(self):
+        """
+        Unmaps the pack. Raw bodies from get_body() are views into the mapping, so if any are still alive the mapping
+        is left for the garbage collector to unmap once they're gone, rather than invalidating them.
+        """
+        try:
+            self._view.release()
+            self._mmap.close()
+        except BufferError:
+            pass
+        self._view = None
+        self._mmap = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def get_relpaths(self):
+        return self._entries.keys()
+
+    def get_stats(self, relpath):
+        packed_entry = self._entries[relpath]
+        return packed_entry["size"], packed_entry["mtime_ns"]
+
+    def get_body(self, relpath):
+        """
+        Returns the entry's bytes: a zero-copy memoryview into the pack for raw bodies, or bytes for compressed ones
+        """
+        packed_entry = self._entries[relpath]
+        body = self._view[packed_entry["offset"]:packed_entry["offset"] + packed_entry["length"]]
+        if packed_entry["encoding"] == ZLIB_ENCODING:
+            return zlib.decompress(body)
+        return body
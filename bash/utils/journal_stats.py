@@ -0,0 +1,174 @@
+"""
+Writing statistics (streaks, words per day/week/month, entry length trends) over the journal
+
+Counting words means reading every entry, which is slow on a synced mount, so per-file word/line/character counts
+are cached locally, keyed by path, size, and mtime; only new or changed files get re-read, on a thread pool.
+Aggregates are bucketed by creation_timestamp into flat arrays indexed by day/week/month number (NumPy's bincount
+when it's installed) rather than updating a dict per entry.
+"""
+
+import os
+import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+import journal_core
+import journal_pack
+
+STATS_CACHE_FILENAME = "stats.json"
+
+DAY_PERIOD = "day"
+WEEK_PERIOD = "week"
+MONTH_PERIOD = "month"
+
+def _count_text(text):
+    return [len(text.split()), text.count("\n"), len(text)]
+
+def _count_file(filepath):
+    try:
+        with open(filepath, encoding="utf-8", errors="replace") as entry_fp:
+            return _count_text(entry_fp.read())
+    except OSError:
+        return None
+
+def load_file_counts(roots, use_pack=False):
+    """
+    Returns [(entry, [words, lines, chars])] for every entry in the roots, re-reading only files whose size or mtime
+    changed since they were last counted. With use_pack, each root's pack is brought up to date and changed entries
+    are counted out of it rather than read one by one.
+    """
+    results = []
+    for root in roots:
+        cache_filepath = os.path.join(journal_core.get_root_cache_dirpath(root), STATS_CACHE_FILENAME)
+        cached_counts = journal_core.read_json_cache(cache_filepath) or {}
+
+        pack = None
+        if use_pack:
+            journal_pack.update_pack(root)
+            pack = journal_pack.Pack(root)
+            file_stats = {os.path.join(root, relpath): pack.get_stats(relpath) for relpath in pack.get_relpaths()}
+        else:
+            file_stats = journal_core.stat_root_entries(root)
+
+        new_cache = {}
+        to_read = []    # (filepath, size, mtime_ns)
+        for filepath, (size, mtime_ns) in file_stats.items():
+            cached = cached_counts.get(filepath)
+            if cached is not None and cached[0] == size and cached[1] == mtime_ns:
+                new_cache[filepath] = cached
+            else:
+                to_read.append((filepath, size, mtime_ns))
+
+        if pack is not None:
+            with pack:
+                for filepath, size, mtime_ns in to_read:
+                    text = str(pack.get_body(os.path.relpath(filepath, root)), "utf-8", "replace")
+                    new_cache[filepath] = [size, mtime_ns] + _count_text(text)
+        else:
+            with ThreadPoolExecutor(max_workers=journal_core.ENTRY_READ_MAX_WORKERS) as pool:
+                fresh_counts = pool.map(_count_file, [filepath for filepath, _, _ in to_read])
+                for (filepath, size, mtime_ns), counts in zip(to_read, fresh_counts):
+                    if counts is not None:
+                        new_cache[filepath] = [size, mtime_ns] + counts
+
+        # Rewriting also drops files that no longer exist
+        if len(to_read) > 0 or len(new_cache) != len(cached_counts):
+            journal_core.write_json_cache(cache_filepath, new_cache)
+
+        for filepath, cached in new_cache.items():
+            entry = journal_core.EntryAndMetadata(os.path.basename(filepath), os.path.dirname(filepath))
+            results.append((entry, cached[2:]))
+    return results
+
+def _bucket_sums(bucket_idxs, weights, num_buckets):
+    if numpy is not None:
+        return numpy.bincount(numpy.asarray(bucket_idxs, dtype=numpy.int64), weights=weights, minlength=num_buckets).tolist()
+    sums = [0] * num_buckets
+    for bucket_idx, weight in zip(bucket_idxs, weights):
+        sums[bucket_idx] += weight
+    return sums
+
+def _get_bucket_key(date, period):
+    if period == DAY_PERIOD:
+        return date.toordinal()
+    if period == WEEK_PERIOD:
+        # Ordinal 1 (0001-01-01) is a Monday, so this groups Monday-Sunday weeks
+        return (date.toordinal() - 1) // 7
+    return date.year * 12 + date.month - 1
+
+def _get_bucket_label(bucket_key, period):
+    if period == DAY_PERIOD:
+        return datetime.date.fromordinal(bucket_key).isoformat()
+    if period == WEEK_PERIOD:
+        return "week of %s" % datetime.date.fromordinal(bucket_key * 7 + 1).isoformat()
+    return "%04d-%02d" % (bucket_key // 12, bucket_key % 12 + 1)
+
+class JournalStats:
+    def __init__(self, entry_counts):
+        # Undated entries can't be placed on a timeline, but still count towards the totals
+        self.total_entries = len(entry_counts)
+        self.total_words = sum(counts[0] for _, counts in entry_counts)
+        self.total_lines = sum(counts[1] for _, counts in entry_counts)
+        self.total_chars = sum(counts[2] for _, counts in entry_counts)
+        self._dated = [
+            (entry.creation_timestamp.date(), counts[0])
+            for entry, counts in entry_counts
+            if entry.creation_timestamp != journal_core.EntryAndMetadata.MISSING_DATE_FORMAT_DATE
+        ]
+
+    def get_buckets(self, period):
+        """
+        Returns [(label, num entries, num words)] for every period from the first dated entry to today
+        """
+        if len(self._dated) == 0:
+            return []
+        first_key = min(_get_bucket_key(date, period) for date, _ in self._dated)
+        last_key = max(
+            _get_bucket_key(datetime.date.today(), period),
+            max(_get_bucket_key(date, period) for date, _ in self._dated),
+        )
+        bucket_idxs = [_get_bucket_key(date, period) - first_key for date, _ in self._dated]
+        num_buckets = last_key - first_key + 1
+        entry_counts = _bucket_sums(bucket_idxs, [1] * len(bucket_idxs), num_buckets)
+        word_counts = _bucket_sums(bucket_idxs, [words for _, words in self._dated], num_buckets)
+        return [
+            (_get_bucket_label(first_key + idx, period), int(entry_counts[idx]), int(word_counts[idx]))
+            for idx in range(num_buckets)
+        ]
+
+    def get_streaks(self):
+        """
+        Returns (current streak, longest streak) of consecutive days with at least one entry
+        """
+        daily_entry_counts = [num_entries for _, num_entries, _ in self.get_buckets(DAY_PERIOD)]
+        longest_streak = 0
+        running_streak = 0
+        for num_entries in daily_entry_counts:
+            running_streak = running_streak + 1 if num_entries > 0 else 0
+            longest_streak = max(longest_streak, running_streak)
+
+        # A streak isn't broken until today ends without an entry
+        if len(daily_entry_counts) > 0 and daily_entry_counts[-1] == 0:
+            daily_entry_counts.pop()
+        current_streak = 0
+        for num_entries in reversed(daily_entry_counts):
+            if num_entries == 0:
+                break
+            current_streak += 1
+        return current_streak, longest_streak
+
+    def render(self, period, num_periods):
+        current_streak, longest_streak = self.get_streaks()
+        print("Entries: %d   Words: %d   Lines: %d   Characters: %d" % (self.total_entries, self.total_words, self.total_lines, self.total_chars))
+        if self.total_entries > 0:
+            print("Average entry length: %.0f words" % (self.total_words / self.total_entries))
+        print("Current streak: %d days   Longest streak: %d days" % (current_streak, longest_streak))
+        print("")
+        print("%-20s %8s %8s %14s" % (period, "entries", "words", "words/entry"))
+        for label, num_entries, num_words in self.get_buckets(period)[-num_periods:]:
+            words_per_entry = "%.0f" % (num_words / num_entries) if num_entries > 0 else "-"
+            print("%-20s %8d %8d %14s" % (label, num_entries, num_words, words_per_entry))
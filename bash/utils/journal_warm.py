@@ -0,0 +1,143 @@
+"""
+Cache warming for cloud-synced journals
+
+The first read of a file after a sync can take hundreds of milliseconds while the sync client fetches it, which is
+what makes opening or previewing an entry feel slow. Warming reads the selected entries ahead of time with bounded
+parallelism and a rate limit (so the sync client isn't flooded), and remembers each file's mtime at the time it was
+read so a file isn't re-read until it changes.
+"""
+
+import os
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import journal_core
+
+WARM_CACHE_FILENAME = "warm.json"
+
+DEFAULT_MAX_WORKERS = 8
+READ_CHUNK_SIZE = 1024 * 1024
+
+class RateLimiter:
+    """
+    Spaces calls to wait() at least 1/rate seconds apart across all threads; a rate of None means no limit
+    """
+
+    def __init__(self, rate):
+        self._interval = 1.0 / rate if rate else 0.0
+        self._next_time = time.monotonic()
+        self._lock = threading.Lock()
+
+    def wait(self):
+        if self._interval == 0.0:
+            return
+        with self._lock:
+            now = time.monotonic()
+            wait_until = max(self._next_time, now)
+            self._next_time = wait_until + self._interval
+        time.sleep(max(0.0, wait_until - now))
+
+class WarmResult:
+    def __init__(self):
+        self.num_read = 0
+        self.num_skipped = 0
+        self.num_bytes = 0
+        self.failures = []    # (filepath, exception)
+        self.elapsed_s = 0.0
+
+    def render(self):
+        elapsed_s = max(self.elapsed_s, 1e-9)
+        print("Read %d entries (%.1f MiB) in %.2fs: %.1f entries/s, %.2f MiB/s; skipped %d already warm" % (
+            self.num_read,
+            self.num_bytes / (1024 * 1024),
+            self.elapsed_s,
+            self.num_read / elapsed_s,
+            self.num_bytes / (1024 * 1024) / elapsed_s,
+            self.num_skipped,
+        ))
+
+def select_entries(roots, num_entries=None, tags=None, since=None, until=None):
+    """
+    Returns the most recently created entries, newest first, optionally limited to those having any of the tags
+    """
+    tag = None
+    predicate = None
+    if tags:
+        tags = set(tags)
+        if len(tags) == 1:
+            # A single tag can prune partitions while scanning
+            tag = next(iter(tags))
+        else:
+            predicate = lambda entry: not tags.isdisjoint(entry.tags)
+    streams = journal_core.load_sorted_entry_streams(roots, journal_core.TIMESTAMP_SORT, True, predicate, since=since, until=until, tag=tag)
+    merged = journal_core.merge_entry_streams(streams, journal_core.TIMESTAMP_SORT, True)
+    if num_entries is None:
+        return list(merged)
+    return [entry for _, entry in zip(range(num_entries), merged)]
+
+def _read_fully(filepath):
+    num_bytes = 0
+    with open(filepath, "rb") as entry_fp:
+        while True:
+            chunk = entry_fp.read(READ_CHUNK_SIZE)
+            if not chunk:
+                return num_bytes
+            num_bytes += len(chunk)
+
+def _find_root(dirpath):
+    # Partitioned entries live in <root>/YYYY/MM
+    parent_dirpath, month_dirname = os.path.split(dirpath)
+    root_dirpath, year_dirname = os.path.split(parent_dirpath)
+    if journal_core.PARTITION_YEAR_REGEX.fullmatch(year_dirname) and journal_core.PARTITION_MONTH_REGEX.fullmatch(month_dirname):
+        return root_dirpath
+    return dirpath
+
+def warm_entries(entries, max_workers=DEFAULT_MAX_WORKERS, rate=None, force=False):
+    """
+    Reads every entry that hasn't been read since its last modification, returning a WarmResult
+    """
+    result = WarmResult()
+    start_time = time.perf_counter()
+
+    # The warm log lives with each entry's root cache, so group the entries by the root they came from
+    filepaths_by_cache = {}
+    for entry in entries:
+        filepath = os.path.join(entry.dirpath, entry.filename)
+        cache_filepath = os.path.join(journal_core.get_root_cache_dirpath(_find_root(entry.dirpath)), WARM_CACHE_FILENAME)
+        filepaths_by_cache.setdefault(cache_filepath, []).append(filepath)
+
+    rate_limiter = RateLimiter(rate)
+    for cache_filepath, filepaths in filepaths_by_cache.items():
+        warmed_mtimes = journal_core.read_json_cache(cache_filepath) or {}
+        to_read = []    # (filepath, mtime_ns)
+        for filepath in filepaths:
+            try:
+                mtime_ns = os.stat(filepath).st_mtime_ns
+            except OSError as e:
+                result.failures.append((filepath, e))
+                continue
+            if not force and warmed_mtimes.get(filepath) == mtime_ns:
+                result.num_skipped += 1
+            else:
+                to_read.append((filepath, mtime_ns))
+
+        def warm_file(filepath):
+            rate_limiter.wait()
+            return _read_fully(filepath)
+
+        if len(to_read) > 0:
+            with ThreadPoolExecutor(max_workers=min(max_workers, len(to_read))) as pool:
+                futures = [(filepath, mtime_ns, pool.submit(warm_file, filepath)) for filepath, mtime_ns in to_read]
+                for filepath, mtime_ns, future in futures:
+                    try:
+                        result.num_bytes += future.result()
+                    except OSError as e:
+                        result.failures.append((filepath, e))
+                        continue
+                    result.num_read += 1
+                    warmed_mtimes[filepath] = mtime_ns
+            journal_core.write_json_cache(cache_filepath, warmed_mtimes)
+
+    result.elapsed_s = time.perf_counter() - start_time
+    return result
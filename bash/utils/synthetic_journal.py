@@ -0,0 +1,66 @@
+"""
+Generates fake journals in the name~YYYY-MM-DD_HH-MM-SS~tag1,tag2.md layout, for benchmarking
+"""
+
+import os
+import random
+import datetime
+
+NAME_WORDS = [
+    "weekly", "review", "packing", "checklist", "meeting", "notes", "reflection", "ideas", "travel", "budget",
+    "reading", "project", "retro", "planning", "gratitude", "workout", "coaching", "draft", "todo", "call",
+]
+TAGS = ["work", "personal", "health", "finance", "family", "writing", "travel", "coaching", "ops", "learning"]
+
+FIRST_TIMESTAMP = datetime.datetime(2012, 1, 1)
+TIMESTAMP_SPAN_SECONDS = 14 * 365 * 24 * 60 * 60
+
+def generate_filenames(num_entries, seed=0, undated_fraction=0.0, date_only_fraction=0.0):
+    """
+    Returns a list of num_entries unique, randomly-generated entry filenames
+
+    undated_fraction of them will have no timestamp (just 'name.md') and date_only_fraction of them will have a
+    'YYYY-MM-DD' timestamp, mirroring the older entries in a real journal
+    """
+    rng = random.Random(seed)
+    filenames = []
+    for idx in range(num_entries):
+        # The index suffix keeps names unique no matter how many entries we generate
+        name = "-".join(rng.sample(NAME_WORDS, rng.randint(1, 3))) + "-%d" % idx
+        timestamp = FIRST_TIMESTAMP + datetime.timedelta(seconds=rng.randrange(TIMESTAMP_SPAN_SECONDS))
+        tags = ",".join(sorted(rng.sample(TAGS, rng.randint(0, 3))))
+
+        kind_roll = rng.random()
+        if kind_roll < undated_fraction:
+            filenames.append("%s.md" % name)
+        elif kind_roll < undated_fraction + date_only_fraction:
+            filenames.append("%s~%s~%s.md" % (name, timestamp.strftime("%Y-%m-%d"), tags))
+        else:
+            filenames.append("%s~%s~%s.md" % (name, timestamp.strftime("%Y-%m-%d_%H-%M-%S"), tags))
+    return filenames
+
+def generate_body(rng, num_lines=8):
+    return "\n".join(
+        " ".join(rng.choice(NAME_WORDS) for _ in range(rng.randint(3, 15)))
+        for _ in range(num_lines)
+    ) + "\n"
+
+def write_journal(journal_dirpath, filenames, seed=0, num_subdirs=0, subdir_depth=3, files_per_subdir=5):
+    """
+    Writes the entries (with random bodies) into journal_dirpath, plus num_subdirs chains of nested directories
+    subdir_depth deep, each level holding files_per_subdir files, for exercising scans that must skip or recurse
+    """
+    rng = random.Random(seed)
+    os.makedirs(journal_dirpath, exist_ok=True)
+    for filename in filenames:
+        with open(os.path.join(journal_dirpath, filename), "w") as entry_fp:
+            entry_fp.write(generate_body(rng))
+
+    for subdir_idx in range(num_subdirs):
+        subdir_dirpath = journal_dirpath
+        for depth in range(subdir_depth):
+            subdir_dirpath = os.path.join(subdir_dirpath, "subdir-%d-%d" % (subdir_idx, depth))
+            os.makedirs(subdir_dirpath, exist_ok=True)
+            for filename in generate_filenames(files_per_subdir, seed=rng.randrange(2 ** 32)):
+                with open(os.path.join(subdir_dirpath, filename), "w") as entry_fp:
+                    entry_fp.write(generate_body(rng))
@@ -1,7 +1,13 @@
 # Configuration file for ipython.
 
+import os
+import sys
+
 c = get_config()
 
+# This file gets symlinked into the profile, so resolve the link to find the extensions that live alongside it
+sys.path.insert(0, os.path.dirname(os.path.realpath(__file__)))
+
 #------------------------------------------------------------------------------
 # InteractiveShellApp configuration
 #------------------------------------------------------------------------------
@@ -32,7 +38,7 @@ c = get_config()
 # c.InteractiveShellApp.exec_PYTHONSTARTUP = True
 
 # lines of code to run at IPython startup.
-c.InteractiveShellApp.exec_lines = ['%autoreload 2']
+# c.InteractiveShellApp.exec_lines = []
 
 # Enable GUI event loop integration with any of ('glut', 'gtk', 'gtk3', 'osx',
 # 'pyglet', 'qt', 'qt5', 'tk', 'wx').
@@ -51,7 +57,8 @@ c.InteractiveShellApp.exec_lines = ['%autoreload 2']
 # c.InteractiveShellApp.pylab_import_all = True
 
 # A list of dotted module names of IPython extensions to load.
-c.InteractiveShellApp.extensions = ['autoreload']
+# Everything else gets loaded (and timed, see '%startup_report') by lazy_startup; see the LazyStartup section below
+c.InteractiveShellApp.extensions = ['lazy_startup']
 
 # Run the module as a script.
 # c.InteractiveShellApp.module_to_run = ''
@@ -69,6 +76,28 @@ c.InteractiveShellApp.extensions = ['autoreload']
 # A file to be run
 # c.InteractiveShellApp.file_to_run = ''
 
+#------------------------------------------------------------------------------
+# LazyStartup configuration (see lazy_startup.py)
+#------------------------------------------------------------------------------
+
+# Extensions loaded eagerly at startup.
+# targeted_autoreload reloads only modules under $IPYTHON_AUTORELOAD_ROOTS (default: the startup directory, minus
+# the stdlib, site-packages, and other installed code) instead
+# of '%autoreload 2'
+c.LazyStartup.extensions = ['targeted_autoreload']
+
+# Imports that only happen right before the first cell that uses the name, e.g.
+#   {'np': 'import numpy as np'}
+# c.LazyStartup.lazy_imports = {}
+
+# Extensions that only get loaded right before the first cell that uses one of their magics
+c.LazyStartup.lazy_extensions = {
+    'autoreload': ['%autoreload', '%aimport'],
+}
+
+# Print per-item startup timings when the shell opens (also enabled by IPYTHON_STARTUP_REPORT=1)
+# c.LazyStartup.show_report = False
+
 #------------------------------------------------------------------------------
 # TerminalIPythonApp configuration
 #------------------------------------------------------------------------------
@@ -0,0 +1,125 @@
+"""
+IPython extension that times everything the profile does at startup, and defers the expensive parts until first use
+
+Configured from ipython_config.py through c.LazyStartup:
+- extensions / exec_lines: loaded/run eagerly at startup, like their InteractiveShellApp equivalents, but timed
+- lazy_imports: {name: import statement}, run just before the first cell that mentions the name
+- lazy_extensions: {extension: [trigger, ...]}, loaded just before the first cell containing one of the triggers
+
+The timings are printed in the style of 'python -X importtime' by '%startup_report', or at startup if show_report
+(or the IPYTHON_STARTUP_REPORT=1 env var) is set.
+"""
+
+import os
+import re
+import sys
+import time
+
+from traitlets import Bool, Dict, List, Unicode
+from traitlets.config import Configurable
+from IPython.core.magic import Magics, magics_class, line_magic
+
+REPORT_ENV_VAR = "IPYTHON_STARTUP_REPORT"
+
+class LazyStartup(Configurable):
+    extensions = List(Unicode(), help="Extensions to load (and time) at startup").tag(config=True)
+    exec_lines = List(Unicode(), help="Lines of code to run (and time) at startup").tag(config=True)
+    lazy_imports = Dict(help="Map of name -> import statement that defines it, run on the name's first use").tag(config=True)
+    lazy_extensions = Dict(help="Map of extension -> list of strings whose first appearance in a cell loads it").tag(config=True)
+    show_report = Bool(False, help="Print the startup timing report once startup finishes").tag(config=True)
+
+    def __init__(self, shell, **kwargs):
+        super().__init__(parent=shell, **kwargs)
+        self.shell = shell
+        self.timings = []    # (label, seconds)
+        self._pending_loads = {}     # trigger string -> (label, callable that does the load)
+        self._trigger_regex = None
+
+    def _timed(self, label, func):
+        start = time.perf_counter()
+        try:
+            func()
+        except Exception as e:
+            print("[lazy_startup: %s failed: %s]" % (label, e), file=sys.stderr)
+        self.timings.append((label, time.perf_counter() - start))
+
+    def _run_line(self, line):
+        self.shell.run_cell(line, store_history=False, silent=True)
+
+    def run_eager(self):
+        for extension in self.extensions:
+            self._timed("extension %s" % extension, lambda: self.shell.extension_manager.load_extension(extension))
+        for line in self.exec_lines:
+            self._timed("exec_line %s" % line, lambda: self._run_line(line))
+
+    def register_lazy(self):
+        for name, import_statement in self.lazy_imports.items():
+            # Plain exec rather than run_cell, since we're already inside a run_cell when these fire
+            load_func = lambda stmt=import_statement: exec(stmt, self.shell.user_ns)
+            self._pending_loads[name] = ("lazy import %s" % name, load_func)
+        for extension, triggers in self.lazy_extensions.items():
+            load_func = lambda ext=extension: self.shell.extension_manager.load_extension(ext)
+            for trigger in triggers:
+                self._pending_loads[trigger] = ("lazy extension %s" % extension, load_func)
+        self._rebuild_trigger_regex()
+        if len(self._pending_loads) > 0:
+            self.shell.events.register("pre_run_cell", self._load_triggered)
+
+    def _rebuild_trigger_regex(self):
+        if len(self._pending_loads) == 0:
+            self._trigger_regex = None
+            return
+        # The lookarounds keep 'np' from matching inside 'numpy' or 'x.np' without needing a full parse of the cell
+        alternatives = "|".join(re.escape(trigger) for trigger in sorted(self._pending_loads, key=len, reverse=True))
+        self._trigger_regex = re.compile(r"(?<![\w.])(%s)(?!\w)" % alternatives)
+
+    def _load_triggered(self, info):
+        raw_cell = getattr(info, "raw_cell", None)
+        if self._trigger_regex is None or not raw_cell:
+            return
+        triggered = set(self._trigger_regex.findall(raw_cell))
+        if len(triggered) == 0:
+            return
+        already_loaded_labels = set()
+        for trigger in triggered:
+            label, load_func = self._pending_loads.pop(trigger)
+            if label not in already_loaded_labels:
+                self._timed(label, load_func)
+                already_loaded_labels.add(label)
+
+        # An extension may have several triggers; once it's loaded none of them need watching any more
+        for trigger, (label, _) in list(self._pending_loads.items()):
+            if label in already_loaded_labels:
+                del self._pending_loads[trigger]
+        self._rebuild_trigger_regex()
+        if self._trigger_regex is None:
+            self.shell.events.unregister("pre_run_cell", self._load_triggered)
+
+    def format_report(self):
+        lines = ["startup time: self [us] | item"]
+        for label, seconds in self.timings:
+            lines.append("startup time: %9d | %s" % (seconds * 1e6, label))
+        lines.append("startup time: %9d | (total)" % (sum(seconds for _, seconds in self.timings) * 1e6))
+        pending_labels = sorted({label for label, _ in self._pending_loads.values()})
+        if len(pending_labels) > 0:
+            lines.append("not loaded yet: %s" % ", ".join(pending_labels))
+        return "\n".join(lines)
+
+@magics_class
+class LazyStartupMagics(Magics):
+    def __init__(self, shell, lazy_startup):
+        super().__init__(shell)
+        self.lazy_startup = lazy_startup
+
+    @line_magic
+    def startup_report(self, line=""):
+        """Show how long each startup extension, exec line, and lazy load took"""
+        print(self.lazy_startup.format_report())
+
+def load_ipython_extension(ip):
+    lazy_startup = LazyStartup(ip)
+    ip.register_magics(LazyStartupMagics(ip, lazy_startup))
+    lazy_startup.run_eager()
+    lazy_startup.register_lazy()
+    if lazy_startup.show_report or os.environ.get(REPORT_ENV_VAR) == "1":
+        print(lazy_startup.format_report())